@@ -0,0 +1,163 @@
+import queue
+
+import numpy as np
+import multiprocessing as mp
+
+from env import CookieClickerVecEnv
+from numpy_predictor import NumpyPredictor
+
+# torch is only imported by the learner (actor_learn); actor processes run NumpyPredictor and
+# never load it
+
+
+class SharedWeights:
+    """
+    A model's parameters as one flat float32 array in shared memory, plus a version counter.
+    The learner publishes into it, actors copy out of it when the version moves, so the model
+    itself never crosses a process boundary.
+
+    """
+    def __init__(self, state_dict, ctx):
+        self.shapes = [(name, tuple(tensor.shape)) for name, tensor in state_dict.items()]
+        self.array = ctx.RawArray("f", sum(int(np.prod(shape)) for _, shape in self.shapes))
+        self.version = ctx.Value("l", 0, lock=False)
+        self.lock = ctx.Lock()
+
+    def publish(self, state_dict):
+        flat = np.frombuffer(self.array, dtype=np.float32)
+        with self.lock:
+            i = 0
+            for name, shape in self.shapes:
+                values = state_dict[name].detach().cpu().numpy().ravel()
+                flat[i:i + len(values)] = values
+                i += len(values)
+            self.version.value += 1
+
+    def load(self, version):
+        """Returns (weights by name, loaded version), or (None, version) if nothing newer is published."""
+        if self.version.value == version:
+            return None, version
+
+        with self.lock:
+            flat = np.frombuffer(self.array, dtype=np.float32).copy()
+            version = self.version.value
+
+        weights = {}
+        i = 0
+        for name, shape in self.shapes:
+            n = int(np.prod(shape))
+            weights[name] = flat[i:i + n].reshape(shape)
+            i += n
+
+        return weights, version
+
+
+def sample_actions(preds, mask, rng):
+    """One action per row, with probability proportional to pred among the legal actions."""
+    weights = np.cumsum(preds * mask, axis=1)
+    u = rng.random(len(weights)) * weights[:, -1]
+    return (weights < u[:, None]).sum(axis=1)
+
+
+def run_actor(weights, experience, stop, n_envs, max_turns, chunk_steps, seed):
+    """Actor process: play n_envs games with the latest published weights, send experience in chunks."""
+    rng = np.random.default_rng(seed)
+    model = None
+    version = -1
+
+    env = CookieClickerVecEnv(n_envs, max_turns=max_turns, seed=seed)
+    obs, mask = env.reset()
+    input_size = env.observation_size
+
+    while not stop.is_set():
+        new_weights, version = weights.load(version)
+        if new_weights is not None:
+            model = NumpyPredictor(new_weights)
+
+        states = np.empty((chunk_steps, n_envs, input_size), dtype=np.float32)
+        actions = np.empty((chunk_steps, n_envs), dtype=np.int64)
+        rewards = np.empty((chunk_steps, n_envs), dtype=np.float32)
+
+        for t in range(chunk_steps):
+            states[t] = obs
+            actions[t] = sample_actions(model(obs), mask, rng)
+            obs, rewards[t], _, mask = env.step(actions[t])
+
+        chunk = (states.reshape(-1, input_size), actions.reshape(-1), rewards.reshape(-1))
+        while not stop.is_set():
+            try:
+                experience.put(chunk, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+
+    # Don't block exit on chunks the learner will never read
+    experience.cancel_join_thread()
+
+
+def next_chunk(experience, actors, poll=1.0):
+    """
+    Next experience chunk from the queue, checking every poll seconds that some actor is still
+    running. Raises RuntimeError once they have all exited and nothing is left to read.
+
+    """
+    while True:
+        try:
+            return experience.get(timeout=poll)
+        except queue.Empty:
+            if not any(actor.is_alive() for actor in actors):
+                codes = ", ".join(str(actor.exitcode) for actor in actors)
+                raise RuntimeError(f"All actor processes exited (exit codes: {codes})") from None
+
+
+def actor_learn(predictor=None, n_actors=4, n_envs=8, max_turns=1000, n_updates=1000,
+                chunk_steps=32, alpha=0.01, seed=0):
+    """
+    Train predictor with n_actors worker processes generating experience in parallel.
+    Each chunk of experience an actor sends becomes one batched update, after which the new
+    weights are published. Returns the trained predictor.
+
+    """
+    import torch
+    from network import LinearPredictor, train_on_rewards
+
+    ctx = mp.get_context("spawn")
+
+    probe = CookieClickerVecEnv(1)
+    if predictor is None:
+        predictor = LinearPredictor(probe.observation_size, probe.n_actions)
+
+    weights = SharedWeights(predictor.state_dict(), ctx)
+    weights.publish(predictor.state_dict())
+    experience = ctx.Queue(maxsize=4 * n_actors)
+    stop = ctx.Event()
+
+    actors = [
+        ctx.Process(
+            target=run_actor,
+            args=(weights, experience, stop, n_envs, max_turns, chunk_steps, seed + i),
+            daemon=True,
+        )
+        for i in range(n_actors)
+    ]
+    for actor in actors:
+        actor.start()
+
+    try:
+        for _ in range(n_updates):
+            states, actions, rewards = next_chunk(experience, actors)
+            train_on_rewards(predictor, torch.from_numpy(states), torch.from_numpy(actions), torch.from_numpy(rewards), alpha)
+            weights.publish(predictor.state_dict())
+    finally:
+        stop.set()
+        for actor in actors:
+            actor.join(timeout=5)
+            if actor.is_alive():
+                actor.terminate()
+
+    return predictor
+
+
+if __name__ == "__main__":
+    predictor = actor_learn(n_actors=4, n_updates=200)
+    print(predictor)
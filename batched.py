@@ -0,0 +1,362 @@
+import numpy as np
+
+from game import (
+    CookieClickerGame, GameSnapshot,
+    ProducerMultiplierUpgrade, ProducerManyMultiplierUpgrade, ClickerCursorMultiplierUpgrade,
+    ProducerAdditiveUpgrade, GameMultiplierUpgrade, CursorAddPerOtherUpgrade, ClickerAddCPSUpgrade,
+    ProducerMultiPerNGrandmasUpgrade,
+)
+
+
+class BatchTables:
+    """
+    A game Catalog flattened into arrays: per-producer stats and price table, and for every
+    upgrade the effect its purchase has on the batched state.
+
+    """
+    def __init__(self, catalog, max_owned=1000):
+        self.catalog = catalog
+        self.n_producers = P = len(catalog.producers)
+        self.n_upgrades = U = len(catalog.upgrades)
+        self.max_owned = max_owned
+        self.cursor = catalog.cursor
+        self.grandma = catalog.grandma
+
+        self.cpt = np.array([p.cpt for p in catalog.producers], dtype=np.float64)
+        # prices[p, n]: price of producer p with n owned. Last column is never affordable, so no
+        # game owns more than max_owned (restore rejects counts past it).
+        self.prices = np.array([[float(p.get_price(n)) for n in range(max_owned)] + [np.inf] for p in catalog.producers])
+
+        self.cost = np.array([u.cost for u in catalog.upgrades], dtype=np.float64)
+        self.producer_multi = np.ones((U, P))
+        self.add_pre = np.zeros((U, P))
+        self.add_per_other = np.zeros(U)
+        self.game_multi = np.ones(U)
+        self.clicker_multi = np.ones(U)
+        self.cps_add = np.zeros(U)
+
+        # ProducerMultiPerNGrandmasUpgrade: +add_multi per per_n grandmas on one producer
+        bonuses = []
+
+        for i, u in enumerate(catalog.upgrades):
+            if isinstance(u, ProducerMultiplierUpgrade):
+                self.producer_multi[i, u.producer] *= u.multiplier
+            elif isinstance(u, ProducerManyMultiplierUpgrade):
+                for p in u.producers:
+                    self.producer_multi[i, p] *= u.multiplier
+            elif isinstance(u, ClickerCursorMultiplierUpgrade):
+                self.producer_multi[i, u.cursor_producer] *= u.multiplier
+                self.clicker_multi[i] = u.multiplier
+            elif isinstance(u, ProducerAdditiveUpgrade):
+                self.add_pre[i, u.producer] += u.add_amount
+            elif isinstance(u, GameMultiplierUpgrade):
+                self.game_multi[i] = u.multiplier
+            elif isinstance(u, CursorAddPerOtherUpgrade):
+                self.add_per_other[i] = u.add_amount
+            elif isinstance(u, ClickerAddCPSUpgrade):
+                self.cps_add[i] = u.add_amount
+            elif isinstance(u, ProducerMultiPerNGrandmasUpgrade):
+                self.producer_multi[i, u.grandma_producer] *= u.grandma_multi
+                bonuses.append((i, u.add_producer, u.add_multi, u.per_n))
+            else:
+                raise TypeError(f"Upgrade type not supported by the batched engine: {u.__class__.__name__}")
+
+        self.bonus_upgrades = np.array([b[0] for b in bonuses], dtype=np.int64)
+        self.bonus_producers = np.array([b[1] for b in bonuses], dtype=np.int64)
+        self.bonus_add_multi = np.array([b[2] for b in bonuses], dtype=np.float64)
+        self.bonus_per_n = np.array([b[3] for b in bonuses], dtype=np.float64)
+
+        if catalog.update_upgrades:
+            raise TypeError("UpdateUpgrades are not supported by the batched engine")
+
+    _cache = {}
+
+    @classmethod
+    def for_catalog(cls, catalog, max_owned=1000):
+        key = (catalog, max_owned)
+        if key not in cls._cache:
+            cls._cache[key] = cls(catalog, max_owned)
+
+        return cls._cache[key]
+
+
+class BatchedCookieClickerGame:
+    """
+    n_games independent games stored as arrays, following the rules of CookieClickerGame.
+
+    Every action takes one entry per game: a producer/upgrade index, or -1 to do nothing in that
+    game (a scalar applies to all games). They return a bool array of which games it succeeded in.
+    Flat actions (apply_actions, get_action_mask) use the get_all_actions() layout:
+    [click, buy producer 0..P-1, sell producer 0..P-1, buy upgrade 0..U-1].
+
+    """
+    def __init__(self, n_games, game_cls=CookieClickerGame, cookies=0, max_owned=1000):
+        self.n_games = n_games
+        self.tables = t = BatchTables.for_catalog(game_cls.get_catalog(), max_owned)
+        self.rows = np.arange(n_games)
+
+        N, P, U = n_games, t.n_producers, t.n_upgrades
+        self.owned = np.zeros((N, P), dtype=np.int64)
+        self.upgrades = np.zeros((N, U), dtype=bool)
+        self.cookies = np.zeros(N)
+        self.total_cookies = np.zeros(N)
+        self.turn = np.zeros(N, dtype=np.int64)
+        self.cpt = np.zeros(N)
+
+        # cookies / total_cookies are kept as on CookieClickerGame: a base plus a constant rate
+        # since _base_turn, so both engines round the same way. The arrays above always hold
+        # the current values; writes go through _add_cookies.
+        self._base_turn = np.zeros(N, dtype=np.int64)
+        self._cookies_base = np.zeros(N)
+        self._total_base = np.zeros(N)
+        self._rate = np.zeros(N)
+        self._prod_rate = np.zeros(N)
+
+        # Compiled upgrade effects, as on CookieClickerGame / Producer
+        self.producer_multiplier = np.ones((N, P))
+        self.add_pre = np.zeros((N, P))
+        self.add_per_other = np.zeros(N)
+        self.multiplier = np.ones(N)
+        self.clicker_multiplier = np.ones(N)
+        self.clicker_cps_add = np.zeros(N)
+
+        self._cpt_cache = None
+        self._cpc_cache = None
+
+        self.reset(cookies=cookies)
+
+    @property
+    def n_actions(self):
+        return 1 + 2 * self.tables.n_producers + self.tables.n_upgrades
+
+    def reset(self, games=None, cookies=0):
+        """Restore the starting state of the selected games (bool mask or indices, default all)."""
+        games = slice(None) if games is None else games
+
+        self.owned[games] = 0
+        self.upgrades[games] = False
+        self.cookies[games] = cookies
+        self.total_cookies[games] = 0
+        self.turn[games] = 0
+        self.cpt[games] = 0
+
+        self._base_turn[games] = 0
+        self._cookies_base[games] = cookies
+        self._total_base[games] = 0
+        self._rate[games] = 0
+        self._prod_rate[games] = 0
+
+        self.producer_multiplier[games] = 1
+        self.add_pre[games] = 0
+        self.add_per_other[games] = 0
+        self.multiplier[games] = 1
+        self.clicker_multiplier[games] = 1
+        self.clicker_cps_add[games] = 0
+
+        self.invalidate()
+
+    def invalidate(self):
+        self._cpt_cache = None
+        self._cpc_cache = None
+
+    def _get_rows(self, idx):
+        idx = np.broadcast_to(np.asarray(idx, dtype=np.int64), (self.n_games,))
+        return idx, idx >= 0
+
+    def get_n_others(self):
+        return self.owned.sum(axis=1) - self.owned[:, self.tables.cursor]
+
+    def get_production(self):
+        """Per game, per producer production, before the game multiplier."""
+        t = self.tables
+
+        multi = self.producer_multiplier.copy()
+        if len(t.bonus_upgrades):
+            n_grandmas = self.owned[:, t.grandma, None]
+            bonus = np.where(self.upgrades[:, t.bonus_upgrades], 1 + t.bonus_add_multi * n_grandmas / t.bonus_per_n, 1)
+            for j, p in enumerate(t.bonus_producers):
+                multi[:, p] *= bonus[:, j]
+
+        base = t.cpt + self.add_pre
+        base[:, t.cursor] += self.add_per_other * self.get_n_others()
+
+        return base * self.owned * multi
+
+    def get_cpt(self):
+        if self._cpt_cache is None:
+            self._cpt_cache = self.get_production().sum(axis=1) * self.multiplier
+
+        return self._cpt_cache
+
+    def get_cpc(self):
+        if self._cpc_cache is None:
+            add = 1 + self.add_per_other * self.get_n_others() + self.get_cpt() * self.clicker_cps_add
+            self._cpc_cache = add * self.clicker_multiplier
+
+        return self._cpc_cache
+
+    def advance(self, n_turns=1, clicks_per_turn=0):
+        """Move every game n_turns forward, as CookieClickerGame.advance."""
+        self.cpt = self.get_cpt().copy()
+        rate = self.cpt + clicks_per_turn * self.get_cpc() if np.any(clicks_per_turn) else self.cpt
+
+        changed = (rate != self._rate) | (self.cpt != self._prod_rate)
+        if changed.any():
+            self._rebase(changed)
+            self._rate[changed] = rate[changed]
+            self._prod_rate[changed] = self.cpt[changed]
+
+        self.turn += n_turns
+        elapsed = self.turn - self._base_turn
+        np.add(self._cookies_base, self._rate * elapsed, out=self.cookies)
+        np.add(self._total_base, self._prod_rate * elapsed, out=self.total_cookies)
+
+    def _rebase(self, rows):
+        self._cookies_base[rows] = self.cookies[rows]
+        self._total_base[rows] = self.total_cookies[rows]
+        self._base_turn[rows] = self.turn[rows]
+
+    def _add_cookies(self, rows, amount):
+        # As CookieClickerGame's cookies setter: the rows' base restarts at the new amount
+        self.cookies[rows] += amount
+        self._rebase(rows)
+
+    def click(self, games=None):
+        """Click once in the selected games (bool mask, default all)."""
+        if games is None:
+            self._add_cookies(slice(None), self.get_cpc())
+        else:
+            games = np.asarray(games, dtype=bool)
+            self._add_cookies(games, self.get_cpc()[games])
+
+        return np.ones(self.n_games, dtype=bool) if games is None else games
+
+    def get_price(self, idx):
+        idx, active = self._get_rows(idx)
+        safe = np.where(active, idx, 0)
+        return self.tables.prices[safe, self.owned[self.rows, safe]]
+
+    def buy_producer(self, idx):
+        idx, active = self._get_rows(idx)
+        price = self.get_price(idx)
+        ok = active & (price <= self.cookies)
+
+        rows, targets = self.rows[ok], idx[ok]
+        self._add_cookies(rows, -price[ok])
+        self.owned[rows, targets] += 1
+
+        if len(rows):
+            self.invalidate()
+
+        return ok
+
+    def sell_producer(self, idx):
+        idx, active = self._get_rows(idx)
+        safe = np.where(active, idx, 0)
+        ok = active & (self.owned[self.rows, safe] > 0)
+
+        rows, targets = self.rows[ok], idx[ok]
+        self.owned[rows, targets] -= 1
+        self._add_cookies(rows, self.tables.prices[targets, self.owned[rows, targets]])
+
+        if len(rows):
+            self.invalidate()
+
+        return ok
+
+    def buy_upgrade(self, idx):
+        idx, active = self._get_rows(idx)
+        t = self.tables
+        safe = np.where(active, idx, 0)
+        ok = active & ~self.upgrades[self.rows, safe] & (t.cost[safe] <= self.cookies)
+
+        rows, targets = self.rows[ok], idx[ok]
+        if len(rows):
+            self._add_cookies(rows, -t.cost[targets])
+            self.upgrades[rows, targets] = True
+            self._apply_upgrades(rows, targets)
+            self.invalidate()
+
+        return ok
+
+    def _apply_upgrades(self, rows, targets):
+        t = self.tables
+        self.producer_multiplier[rows] *= t.producer_multi[targets]
+        self.add_pre[rows] += t.add_pre[targets]
+        self.add_per_other[rows] += t.add_per_other[targets]
+        self.multiplier[rows] *= t.game_multi[targets]
+        self.clicker_multiplier[rows] *= t.clicker_multi[targets]
+        self.clicker_cps_add[rows] += t.cps_add[targets]
+
+    def get_action_mask(self, out=None):
+        """(n_games, n_actions) bool array of the actions that would succeed right now."""
+        t = self.tables
+        P = t.n_producers
+        if out is None:
+            out = np.empty((self.n_games, self.n_actions), dtype=bool)
+
+        cookies = self.cookies[:, None]
+        out[:, 0] = True
+        out[:, 1:1 + P] = t.prices[np.arange(P), self.owned] <= cookies
+        out[:, 1 + P:1 + 2 * P] = self.owned > 0
+        np.logical_and(~self.upgrades, t.cost <= cookies, out=out[:, 1 + 2 * P:])
+
+        return out
+
+    def apply_actions(self, actions):
+        """Perform one flat action index per game. Returns which succeeded."""
+        P = self.tables.n_producers
+        actions = np.asarray(actions, dtype=np.int64)
+
+        ok = self.click(actions == 0)
+        buy = (actions >= 1) & (actions < 1 + P)
+        sell = (actions >= 1 + P) & (actions < 1 + 2 * P)
+        upgr = actions >= 1 + 2 * P
+
+        ok |= self.buy_producer(np.where(buy, actions - 1, -1))
+        ok |= self.sell_producer(np.where(sell, actions - 1 - P, -1))
+        ok |= self.buy_upgrade(np.where(upgr, actions - 1 - 2 * P, -1))
+
+        return ok
+
+    def snapshot(self, i):
+        """Game i as a GameSnapshot, for CookieClickerGame.restore()."""
+        return GameSnapshot(
+            tuple(int(n) for n in self.owned[i]), sum(1 << int(u) for u in np.flatnonzero(self.upgrades[i])),
+            int(self.turn[i]), float(self.cpt[i]), int(self._base_turn[i]), float(self._cookies_base[i]),
+            float(self._total_base[i]), float(self._rate[i]), float(self._prod_rate[i]),
+        )
+
+    def restore(self, i, snapshot):
+        """
+        Load a CookieClickerGame.snapshot() into game i. Raises ValueError if it owns more of a
+        producer than max_owned.
+
+        """
+        t = self.tables
+        if max(snapshot.producer_counts, default=0) > t.max_owned:
+            raise ValueError(
+                f"Snapshot owns {max(snapshot.producer_counts)} of a producer, more than max_owned={t.max_owned}"
+            )
+
+        self.reset([i])
+        self.owned[i] = snapshot.producer_counts
+        self.upgrades[i] = [(snapshot.upgrade_mask >> u) & 1 for u in range(t.n_upgrades)]
+        targets = np.flatnonzero(self.upgrades[i])
+        self.producer_multiplier[i] = t.producer_multi[targets].prod(axis=0)
+        self.add_pre[i] = t.add_pre[targets].sum(axis=0)
+        self.add_per_other[i] = t.add_per_other[targets].sum()
+        self.multiplier[i] = t.game_multi[targets].prod()
+        self.clicker_multiplier[i] = t.clicker_multi[targets].prod()
+        self.clicker_cps_add[i] = t.cps_add[targets].sum()
+
+        self.turn[i] = snapshot.turn
+        self.cpt[i] = snapshot.cpt
+        self._base_turn[i] = snapshot.base_turn
+        self._cookies_base[i] = snapshot.cookies_base
+        self._total_base[i] = snapshot.total_base
+        self._rate[i] = snapshot.rate
+        self._prod_rate[i] = snapshot.prod_rate
+        self.cookies[i] = snapshot.cookies
+        self.total_cookies[i] = snapshot.total_cookies
+        self.invalidate()
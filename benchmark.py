@@ -0,0 +1,423 @@
+"""
+Benchmarks for the simulation and learning hot paths.
+
+    python benchmark.py results.json
+    python benchmark.py new.json --baseline results.json
+
+Each benchmark runs on games taken to an early, mid and late-game state by the greedy strategy,
+and reports operations per second. Like timeit, every case is looped until one run takes at
+least --min-time, with the garbage collector off. All cases are then timed in --repeat rounds
+and the fastest run of each is kept. Results are written as JSON; with --baseline the run is
+compared against an earlier file of the same format version and exits non-zero if anything got
+slower, or takes more memory per game, than the tolerances allow.
+
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from game import CookieClickerGame
+from player import State
+from solver import TotalCookiesTarget, solve
+from strategy import play_greedy
+
+# Turns of greedy play that bring a fresh game to each stage
+STAGES = {"early": 300, "mid": 3000, "late": 100000}
+SEED = 0
+FORMAT_VERSION = 2
+BATCH = 1000 # inputs prepared at a time for calls that need a fresh one each
+BULK_TURNS = 1000 # turns per advance(n) call in advance_bulk
+MEMORY_GAMES = 200 # games allocated to measure the size of one
+SOLVE_TARGET = 1000 # total cookies for the solver benchmark, solved in a few seconds
+REPEAT = 7
+MIN_TIME = 0.1
+TOLERANCE = 0.5 # allowed slowdown; unchanged trees on a shared machine drift by up to ~45% run to run
+MEMORY_TOLERANCE = 0.02 # allowed growth in bytes per game, which tracemalloc measures exactly
+
+
+def _timed(run, n):
+    # run(n) performs n operations and returns the seconds they took (excluding any setup)
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return run(n)
+    finally:
+        if enabled:
+            gc.enable()
+
+def _autorange(run, min_time):
+    # Operations per timed run, grown as in timeit.Timer.autorange until one takes min_time
+    n = 1
+    while True:
+        for factor in (1, 2, 5):
+            if _timed(run, n * factor) >= min_time:
+                return n * factor
+        n *= 10
+
+def measure(cases, repeat, min_time):
+    """
+    Operations per second of each case ({key: run}, see _timed). Every case is sized with
+    _autorange, then timed once per round over repeat rounds, and its fastest run counts.
+    Interleaving the rounds spreads each case over the whole run, so a slow spell on the
+    machine slows one round of everything rather than every repeat of a few cases.
+
+    """
+    sizes = {key: _autorange(run, min_time) for key, run in cases.items()}
+    best = dict.fromkeys(cases, float("inf"))
+    for _ in range(repeat):
+        for key, run in cases.items():
+            best[key] = min(best[key], _timed(run, sizes[key]))
+
+    return {key: sizes[key] / best[key] for key in cases}
+
+def _bulk(call):
+    # Timer for calls that leave the game unchanged, or change it in a way that doesn't matter
+    def run(n):
+        start = time.perf_counter()
+        for _ in range(n):
+            call()
+        return time.perf_counter() - start
+
+    return run
+
+def _each(setup, call):
+    # Timer for calls that need fresh input: setup() is untimed, call(setup()) is timed
+    def run(n):
+        total = 0
+        while n > 0:
+            args = [setup() for _ in range(min(n, BATCH))]
+            start = time.perf_counter()
+            for arg in args:
+                call(arg)
+            total += time.perf_counter() - start
+            n -= len(args)
+        return total
+
+    return run
+
+
+def make_stage(turns, seed=SEED):
+    """Game after turns of greedy play, quiet, with its random generator seeded."""
+    game = play_greedy(turns, seed=seed)
+    game.verbose = False
+    return game
+
+def _rich_clone(game):
+    # Copy with cookies to spare, so every purchase succeeds
+    other = game.clone()
+    other.cookies = max(other.cookies, 1e30)
+    return other
+
+def _cheapest_upgrade(game):
+    return game.upgrades_by_cost[0][1] if game.upgrades_by_cost else None
+
+
+def bench_game(game):
+    """Timed cases for the CookieClickerGame hot paths, starting from game each time."""
+    cases = {}
+
+    def advance(n):
+        g = game.clone()
+        start = time.perf_counter()
+        for _ in range(n):
+            g.advance()
+        return time.perf_counter() - start
+
+    cases["advance"] = advance
+
+    # advance(n) is O(1) in n, so this counts turns advanced in BULK_TURNS-turn jumps
+    bulk = game.clone()
+
+    def advance_bulk(n):
+        start = time.perf_counter()
+        for _ in range(n // BULK_TURNS):
+            bulk.advance(BULK_TURNS)
+        bulk.advance(n % BULK_TURNS)
+        return time.perf_counter() - start
+
+    cases["advance_bulk"] = advance_bulk
+
+    g = game.clone()
+    cases["get_cpt"] = _bulk(g.get_cpt)
+    cases["get_cpc"] = _bulk(g.get_cpc)
+
+    def get_cpt_uncached():
+        g.invalidate()
+        g.get_cpt()
+
+    def get_cpc_uncached():
+        g.invalidate()
+        g.get_cpc()
+
+    cases["get_cpt_uncached"] = _bulk(get_cpt_uncached)
+    cases["get_cpc_uncached"] = _bulk(get_cpc_uncached)
+    cases["get_available_actions"] = _bulk(g.get_available_actions)
+
+    rich = _rich_clone(game)
+    cases["random_action"] = _each(rich.clone, lambda g: g.random_action())
+
+    cheapest_producer = game.producers_by_price[0][1]
+    cases["buy_producer"] = _each(rich.clone, lambda g: g.buy_producer(cheapest_producer))
+
+    upgrade = _cheapest_upgrade(game)
+    if upgrade is not None:
+        cases["buy_upgrade"] = _each(rich.clone, lambda g: g.buy_upgrade(upgrade))
+
+    return cases
+
+def bench_state(game):
+    """Timed cases for the player.State methods on a copy of game."""
+    cases = {}
+
+    state = State(game.clone())
+    cases["State"] = _each(game.clone, State)
+    cases["State.refresh"] = _bulk(state.refresh)
+    cases["State.get_state"] = _bulk(state.get_state)
+    cases["State.get_action_availability"] = _bulk(state.get_action_availability)
+    cases["State.prediction_to_action"] = _bulk(lambda: state.prediction_to_action(1))
+
+    # A random legal action, then the turn advance, as in reinforcement_learn. Every BATCH
+    # actions play on from a fresh copy of game, so the stage doesn't drift with n
+    def legal_pred(state):
+        legal = state.get_action_availability().nonzero()[0]
+        return int(legal[state.game.rng.randrange(len(legal))])
+
+    def perform(n):
+        total = 0
+        while n > 0:
+            s = State(game.clone())
+            s.game.rng.seed(SEED)
+            preds = []
+            for _ in range(min(n, BATCH)):
+                preds.append(legal_pred(s))
+                s.perform_action(s.prediction_to_action(preds[-1]))
+
+            # Replay the same actions on another copy, timed
+            s = State(game.clone())
+            actions = [s.prediction_to_action(pred) for pred in preds]
+            start = time.perf_counter()
+            for action in actions:
+                s.perform_action(action)
+            total += time.perf_counter() - start
+            n -= len(actions)
+        return total
+
+    cases["State.perform_action"] = perform
+
+    return cases
+
+def bench_memory(game, n=MEMORY_GAMES):
+    """Bytes allocated per game copy of game, and per fresh game, measured with tracemalloc."""
+    results = {}
+
+    for name, make in (("clone", game.clone), ("new", lambda: CookieClickerGame(verbose=False))):
+        make() # first-use allocations (catalog, caches) aren't per instance
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        games = [make() for _ in range(n)]
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del games
+        results[f"bytes_per_game_{name}"] = (after - before) / n
+
+    return results
+
+def bench_construction(game):
+    """Timed cases for building games from scratch, and bringing them to game's state by restore / clone."""
+    snapshot = game.snapshot()
+    target = CookieClickerGame(verbose=False)
+
+    return {
+        "CookieClickerGame": _bulk(lambda: CookieClickerGame(verbose=False)),
+        "restore": _bulk(lambda: target.restore(snapshot)),
+        "clone": _bulk(game.clone),
+    }
+
+def bench_reinforcement_learn():
+    """
+    Timed case for reinforcement_learn steps with a fresh LinearPredictor. It always plays from a
+    new game, so this doesn't depend on the stage. None without torch.
+
+    """
+    try:
+        import torch
+        from network import LinearPredictor
+    except ImportError:
+        return None
+
+    from player import reinforcement_learn
+
+    torch.manual_seed(SEED)
+    state = State(CookieClickerGame(verbose=False))
+    predictor = LinearPredictor(len(state.get_state()), state.get_action_space())
+
+    def run(n):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            reinforcement_learn(predictor, n)
+            return time.perf_counter() - start
+
+    return run
+
+def bench_solve():
+    """Timed case for single-process solve() runs to TotalCookiesTarget(SOLVE_TARGET) from a new game."""
+    def run(n):
+        start = time.perf_counter()
+        for _ in range(n):
+            solve(TotalCookiesTarget(SOLVE_TARGET), workers=1)
+        return time.perf_counter() - start
+
+    return run
+
+
+def run_all(repeat=REPEAT, min_time=MIN_TIME, stages=STAGES):
+    """All benchmarks, as the JSON-ready dict written by main()."""
+    cases = {}
+    memory = {}
+    for stage, turns in stages.items():
+        game = make_stage(turns)
+        for bench in (bench_game, bench_state, bench_construction):
+            cases.update(((stage, name), run) for name, run in bench(game).items())
+        memory[stage] = bench_memory(game)
+
+    rl = bench_reinforcement_learn()
+    if rl is not None:
+        cases["-", "reinforcement_learn"] = rl
+    cases["-", "solve"] = bench_solve()
+
+    rates = measure(cases, repeat, min_time)
+
+    results = {}
+    for stage, turns in stages.items():
+        results[stage] = {
+            "turns": turns,
+            "ops_per_sec": {name: rate for (s, name), rate in rates.items() if s == stage},
+            "memory": memory[stage],
+        }
+
+    return {
+        "version": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "min_time": min_time,
+        "stages": results,
+        "reinforcement_learn_steps_per_sec": rates.get(("-", "reinforcement_learn")),
+        "solves_per_sec": rates["-", "solve"],
+    }
+
+def compare(current, baseline, tolerance=TOLERANCE, memory_tolerance=MEMORY_TOLERANCE):
+    """
+    (stage, name, baseline, current, ratio) for every figure in both runs, and whether any rate
+    fell by more than tolerance or any per-game memory figure grew by more than memory_tolerance
+    (both fractions).
+
+    """
+    rows = []
+    regressed = False
+    for stage, cur in current["stages"].items():
+        base = baseline["stages"].get(stage)
+        if base is None:
+            continue
+
+        for name, rate in cur["ops_per_sec"].items():
+            old = base["ops_per_sec"].get(name)
+            if old:
+                ratio = rate / old
+                rows.append((stage, name, old, rate, ratio))
+                regressed |= ratio < 1 - tolerance
+
+        for name, size in cur["memory"].items():
+            old = base["memory"].get(name)
+            if old:
+                ratio = size / old
+                rows.append((stage, name, old, size, ratio))
+                regressed |= ratio > 1 + memory_tolerance
+
+    for key, name in (("reinforcement_learn_steps_per_sec", "reinforcement_learn"), ("solves_per_sec", "solve")):
+        old = baseline.get(key)
+        rate = current.get(key)
+        if old and rate:
+            ratio = rate / old
+            rows.append(("-", name, old, rate, ratio))
+            regressed |= ratio < 1 - tolerance
+
+    return rows, regressed
+
+def format_results(results):
+    lines = []
+    for stage, res in results["stages"].items():
+        lines.append(f"{stage} ({res['turns']} turns):")
+        for name, rate in res["ops_per_sec"].items():
+            lines.append(f"  {name:<35s}{rate:>15,.0f} /s")
+        for name, size in res["memory"].items():
+            lines.append(f"  {name:<35s}{size:>15,.0f} B")
+
+    rl = results["reinforcement_learn_steps_per_sec"]
+    lines.append(f"reinforcement_learn: {'skipped (no torch)' if rl is None else f'{rl:,.0f} steps/s'}")
+    lines.append(f"solve (TotalCookiesTarget({SOLVE_TARGET})): {results['solves_per_sec']:.2f} /s")
+    return "\n".join(lines)
+
+def _figure(value):
+    # Rates and sizes in 15 columns, with decimals only for small ones (solves per second)
+    return f"{value:>15,.0f}" if value >= 100 else f"{value:>15,.3f}"
+
+def format_comparison(rows):
+    lines = [f"{'Stage':<8s}{'Benchmark':<35s}{'Baseline':>15s}{'Current':>15s}{'Ratio':>8s}"]
+    for stage, name, old, new, ratio in rows:
+        lines.append(f"{stage:<8s}{name:<35s}{_figure(old)}{_figure(new)}{ratio:>8.2f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output", nargs="?", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file from an earlier run to compare against")
+    parser.add_argument(
+        "--tolerance", type=float, default=TOLERANCE,
+        help="allowed slowdown as a fraction. The default is loose (a 2x slowdown passes) to absorb "
+             "timing noise on shared machines; use a smaller value on a quiet one",
+    )
+    parser.add_argument(
+        "--memory-tolerance", type=float, default=MEMORY_TOLERANCE,
+        help="allowed growth of bytes per game as a fraction",
+    )
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="timed rounds over all benchmarks, the fastest run of each counts")
+    parser.add_argument("--min-time", type=float, default=MIN_TIME, help="seconds one timed run lasts at least")
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("version") != FORMAT_VERSION:
+            print(
+                f"{args.baseline} is results format version {baseline.get('version')}, this benchmark "
+                f"writes version {FORMAT_VERSION}: the runs can't be compared, make a new baseline",
+                file=sys.stderr,
+            )
+            return 2
+
+    results = run_all(args.repeat, args.min_time)
+    print(format_results(results))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        rows, regressed = compare(results, baseline, args.tolerance, args.memory_tolerance)
+        print(format_comparison(rows))
+        return 1 if regressed else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import numpy as np
+
+from game import CookieClickerGame
+
+
+class CookieClickerVecEnv:
+    """
+    n_envs CookieClickerGames behind a batched reset() / step() interface.
+
+    Observations are producer counts followed by upgrade ownership bits (the player.State layout),
+    actions are flat indices in the get_all_actions() layout (game.catalog.actions).
+    Rewards are the change in cpt over the step, as player.State.perform_action.
+
+    reset() and step() return the same preallocated arrays every call; copy them if they need to
+    outlive the next step. Finished games are reset automatically, so the observation and mask
+    returned alongside done=True already belong to the next episode.
+
+    """
+    def __init__(self, n_envs, max_turns=1000, start_cookies=100, game_cls=CookieClickerGame, seed=None):
+        self.n_envs = n_envs
+        self.max_turns = max_turns
+        self.start_cookies = start_cookies
+
+        self.games = [
+            game_cls(verbose=False, seed=None if seed is None else seed + i)
+            for i in range(n_envs)
+        ]
+        catalog = self.games[0].catalog
+        self.actions = catalog.actions
+        self.n_producers = len(catalog.producers)
+        self.n_upgrades = len(catalog.upgrades)
+
+        self.observation_size = self.n_producers + self.n_upgrades
+        self.n_actions = len(self.actions)
+
+        self.observations = np.zeros((n_envs, self.observation_size), dtype=np.float32)
+        self.rewards = np.zeros(n_envs, dtype=np.float32)
+        self.dones = np.zeros(n_envs, dtype=bool)
+        self.action_masks = np.zeros((n_envs, self.n_actions), dtype=bool)
+
+    def reset(self):
+        for i in range(self.n_envs):
+            self._reset_env(i)
+
+        self.rewards[:] = 0
+        self.dones[:] = False
+
+        return self.observations, self.action_masks
+
+    def _reset_env(self, i):
+        self.games[i].reset(cookies=self.start_cookies)
+        self.observations[i] = 0
+        self._update_mask(i)
+
+    def step(self, actions):
+        """
+        Perform actions[i] in game i, then advance every game one turn.
+        Returns (observations, rewards, dones, action_masks).
+
+        """
+        P = self.n_producers
+        obs = self.observations
+
+        for i, action in enumerate(actions):
+            game = self.games[i]
+            action = int(action)
+            old_value = game.cpt
+
+            if game.do_action(action):
+                # Only the entry the action touched can have changed
+                kind, target = self.actions[action]
+                if kind == "buy_upgrade":
+                    obs[i, P + target] = 1
+                elif target is not None:
+                    obs[i, target] = game.producers[target].n_owned
+
+            game.advance()
+            self.rewards[i] = game.cpt - old_value
+
+            done = game.turn >= self.max_turns
+            self.dones[i] = done
+            if done:
+                self._reset_env(i)
+            else:
+                self._update_mask(i)
+
+        return self.observations, self.rewards, self.dones, self.action_masks
+
+    def _update_mask(self, i):
+        self.games[i].fill_action_mask(self.action_masks[i])
+
+    def sample_actions(self, rng=None):
+        """Uniformly random legal action per game."""
+        rng = rng or np.random.default_rng()
+        noise = rng.random(self.action_masks.shape)
+        return np.argmax(np.where(self.action_masks, noise, -1), axis=1)
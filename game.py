@@ -1,11 +1,9 @@
+import bisect
+import heapq
+import math
 import random
 from abc import abstractmethod, ABCMeta
-import operator as op
-from functools import reduce
-import copy
-
-def prod(values):
-    return reduce(op.mul, values, 1)
+from collections import namedtuple
 
 def format_large_num(x):
     """
@@ -34,14 +32,38 @@ def format_large_num(x):
 
 
 class Upgrade:
+    """
+    Upgrades are shared between games: they describe what buying them does, ownership lives on
+    the game (CookieClickerGame.upgrade_mask). Producer references are indices into game.producers.
+    
+    """
+    __slots__ = ("name", "cost", "idx")
+    
+    click_effect = False # whether buy() changes the cookies per click terms
+
     def __init__(self, name, cost):
         self.name = name
         self.cost = cost
         
-        self.owned = False
+        self.idx = None # position in the catalog, set when it is compiled
+        
+    def buy(self, game):
+        pass
+        
+    def marginal_gain(self, game):
+        """
+        (d_cpt, d_cpc) buying this upgrade would cause, from the game's current effects.
+        Expects game.get_cpt() to be up to date, so producer.production is current.
+        
+        """
+        return 0, 0
         
-    def buy(self):
-        self.owned = True
+    def affected_producers(self):
+        """Indices of the producers whose effects buy() changes."""
+        return ()
+        
+    def format(self, game):
+        return str(self)
         
     def __str__(self):
         parts = [
@@ -52,19 +74,41 @@ class Upgrade:
         return "".join(parts)
             
 class UpdateUpgrade(Upgrade, metaclass=ABCMeta):
+    """
+    Upgrade whose update(game) runs every period turns once it is owned.
+    snapshot() / restore() keep what update() folds into the compiled effects (game.multiplier,
+    producer multipliers, ...) and the pending update events. Any other state it keeps on the
+    game is only carried over by clone().
+    
+    """
+    __slots__ = ()
+    
+    period = 1
+    
+    def buy(self, game):
+        game.schedule(game.turn, UpgradeUpdate(self))
+    
     @abstractmethod
-    def update(self):
+    def update(self, game):
         pass
         
 class ProducerMultiplierUpgrade(Upgrade):
+    __slots__ = ("producer", "multiplier")
+    
     def __init__(self, name, cost, producer, multiplier):
         super().__init__(name, cost)
         self.producer = producer
         self.multiplier = multiplier
         
-    def buy(self):
-        super().buy()
-        self.producer.add_multi_func(self.get_multiplier)
+    def buy(self, game):
+        game.producers[self.producer].multiplier *= self.multiplier
+        
+    def marginal_gain(self, game):
+        d_cpt = game.producers[self.producer].production * (self.multiplier - 1) * game.get_multi()
+        return d_cpt, game._cpc_delta(d_cpt)
+        
+    def affected_producers(self):
+        return (self.producer,)
         
     def get_multiplier(self):
         return self.multiplier
@@ -78,15 +122,24 @@ class ProducerMultiplierUpgrade(Upgrade):
         return "".join(parts)
         
 class ProducerManyMultiplierUpgrade(Upgrade):
+    __slots__ = ("producers", "multiplier")
+    
     def __init__(self, name, cost, producers, multiplier):
         super().__init__(name, cost)
-        self.producers = producers
+        self.producers = tuple(producers)
         self.multiplier = multiplier
     
-    def buy(self):
-        super().buy()
+    def buy(self, game):
         for p in self.producers:
-            p.add_multi_func(self.get_multiplier)
+            game.producers[p].multiplier *= self.multiplier
+            
+    def marginal_gain(self, game):
+        production = sum(game.producers[p].production for p in self.producers)
+        d_cpt = production * (self.multiplier - 1) * game.get_multi()
+        return d_cpt, game._cpc_delta(d_cpt)
+        
+    def affected_producers(self):
+        return self.producers
         
     def get_multiplier(self):
         return self.multiplier
@@ -100,16 +153,25 @@ class ProducerManyMultiplierUpgrade(Upgrade):
         return "".join(parts)
 
 class ClickerCursorMultiplierUpgrade(Upgrade):
-    def __init__(self, name, cost, cursor_producer, game, multiplier):
+    __slots__ = ("cursor_producer", "multiplier")
+    
+    click_effect = True
+    
+    def __init__(self, name, cost, cursor_producer, multiplier):
         super().__init__(name, cost)
         self.cursor_producer = cursor_producer
         self.multiplier = multiplier
-        self.game = game
         
-    def buy(self):
-        super().buy()
-        self.cursor_producer.add_multi_func(self.get_multiplier)
-        self.game.clicker_multiplier_funcs.append(self.get_multiplier)
+    def buy(self, game):
+        game.producers[self.cursor_producer].multiplier *= self.multiplier
+        game.clicker_multiplier *= self.multiplier
+        
+    def marginal_gain(self, game):
+        d_cpt = game.producers[self.cursor_producer].production * (self.multiplier - 1) * game.get_multi()
+        return d_cpt, game._cpc_delta(d_cpt, clicker_multiplier=game.clicker_multiplier * self.multiplier)
+        
+    def affected_producers(self):
+        return (self.cursor_producer,)
         
     def get_multiplier(self):
         return self.multiplier
@@ -123,27 +185,41 @@ class ClickerCursorMultiplierUpgrade(Upgrade):
         return "".join(parts)
 
 class ProducerAdditiveUpgrade(Upgrade):
+    __slots__ = ("producer", "add_amount")
+    
     def __init__(self, name, cost, producer, add_amount):
         super().__init__(name, cost)
         self.producer = producer
         self.add_amount = add_amount
         
-    def buy(self):
-        super().buy()
-        self.producer.add_add_pre_func(self.get_add)
+    def buy(self, game):
+        game.producers[self.producer].add_pre += self.add_amount
+        
+    def marginal_gain(self, game):
+        prod = game.producers[self.producer]
+        n_grandmas = game.producers[game.catalog.grandma].n_owned
+        d_cpt = self.add_amount * prod.n_owned * prod.get_multi(n_grandmas) * game.get_multi()
+        return d_cpt, game._cpc_delta(d_cpt)
+        
+    def affected_producers(self):
+        return (self.producer,)
         
     def get_add(self):
         return self.add_amount
         
 class GameMultiplierUpgrade(Upgrade):
-    def __init__(self, name, cost, game, multiplier):
+    __slots__ = ("multiplier",)
+    
+    def __init__(self, name, cost, multiplier):
         super().__init__(name, cost)
-        self.game = game
         self.multiplier = multiplier
         
-    def buy(self):
-        super().buy()
-        self.game.multiplier_funcs.append(self.get_multiplier)
+    def buy(self, game):
+        game.multiplier *= self.multiplier
+        
+    def marginal_gain(self, game):
+        d_cpt = game.get_cpt() * (self.multiplier - 1)
+        return d_cpt, game._cpc_delta(d_cpt)
         
     def get_multiplier(self):
         return self.multiplier
@@ -157,55 +233,71 @@ class GameMultiplierUpgrade(Upgrade):
         return "".join(parts)
         
 class CursorAddPerOtherUpgrade(Upgrade):
-    def __init__(self, name, cost, producers, game, add_amount):
+    __slots__ = ("cursor_producer", "add_amount")
+    
+    click_effect = True
+    
+    def __init__(self, name, cost, cursor_producer, add_amount):
         super().__init__(name, cost)
-        self.cursor_producer = next(p for p in producers if p.name == "cursor")
-        self.other_producers = [p for p in producers if p.name != "cursor"]
+        self.cursor_producer = cursor_producer
         self.add_amount = add_amount
-        self.game = game
         
-        self.old_n_owned = 0
+    def buy(self, game):
+        game.clicker_add_per_other += self.add_amount
+        game.producers[self.cursor_producer].add_per_other += self.add_amount
         
-    def buy(self):
-        super().buy()
-        self.game.clicker_add_funcs.append(self.get_add)
-        self.cursor_producer.add_add_pre_func(self.get_add)
+    def marginal_gain(self, game):
+        # Every non-cursor building adds to each cursor and to each click
+        cursor = game.producers[self.cursor_producer]
+        n_others = game.get_n_others()
+        n_grandmas = game.producers[game.catalog.grandma].n_owned
+        d_cpt = self.add_amount * n_others * cursor.n_owned * cursor.get_multi(n_grandmas) * game.get_multi()
+        return d_cpt, game._cpc_delta(d_cpt, clicker_add_per_other=game.clicker_add_per_other + self.add_amount)
         
-    def get_add(self):
-        new_n_owned = sum(p.n_owned for p in self.other_producers)
-        return self.add_amount * new_n_owned
+    def affected_producers(self):
+        return (self.cursor_producer,)
         
-    def __str__(self):
+    def get_add(self, game):
+        return self.add_amount * game.get_n_others()
+        
+    def format(self, game):
         parts = [
             super().__str__(),
-            f"+{self.get_add():.1f}"
+            f"+{self.get_add(game):.1f}"
         ]
         
         return "".join(parts)
 
 class ClickerAddCPSUpgrade(Upgrade):
-    def __init__(self, name, cost, game, add_amount):
+    __slots__ = ("add_amount",)
+    
+    click_effect = True
+    
+    def __init__(self, name, cost, add_amount):
         super().__init__(name, cost)
-        self.game = game
         self.add_amount = add_amount
         
-    def buy(self):
-        super().buy()
-        self.game.clicker_add_funcs.append(self.get_add)
+    def buy(self, game):
+        game.clicker_cps_add += self.add_amount
         
-    def get_add(self):
-        return self.game.get_cpt() * self.add_amount
+    def marginal_gain(self, game):
+        return 0, game._cpc_delta(0, clicker_cps_add=game.clicker_cps_add + self.add_amount)
         
-    def __str__(self):
+    def get_add(self, game):
+        return game.get_cpt() * self.add_amount
+        
+    def format(self, game):
         parts = [
             super().__str__(),
-            f"+{self.get_add():.1f}"
+            f"+{self.get_add(game):.1f}"
         ]
         
         return "".join(parts)
         
         
 class ProducerMultiPerNGrandmasUpgrade(Upgrade):
+    __slots__ = ("add_producer", "add_multi", "grandma_producer", "grandma_multi", "per_n")
+    
     def __init__(self, name, cost, producer, grandma_producer, grandma_multi, prod_add_multi, per_n):
         super().__init__(name, cost)
         self.add_producer = producer
@@ -213,33 +305,279 @@ class ProducerMultiPerNGrandmasUpgrade(Upgrade):
         self.grandma_producer = grandma_producer
         self.grandma_multi = grandma_multi
         self.per_n = per_n
-        
-        self.old_n_owned = 0
     
-    def buy(self):
-        super().buy()
-        self.grandma_producer.multiplier_funcs.append(self.get_multiplier_grandma)
-        self.add_producer.multiplier_funcs.append(self.get_multiplier_producer)
-        
-    def get_multiplier_producer(self):
-        return 1 + self.add_multi * self.grandma_producer.n_owned / self.per_n
+    def buy(self, game):
+        game.producers[self.grandma_producer].multiplier *= self.grandma_multi
+        add_producer = game.producers[self.add_producer]
+        # Kept in catalog order, so the product in get_multi doesn't depend on the purchase order
+        bonuses = list(add_producer.grandma_bonuses)
+        bisect.insort(bonuses, (self.idx, self.add_multi, self.per_n))
+        add_producer.grandma_bonuses = tuple(bonuses)
+        
+    def marginal_gain(self, game):
+        # Grandmas get the flat multiplier, add_producer +add_multi per per_n grandmas
+        factors = {self.grandma_producer: self.grandma_multi}
+        bonus = 1 + self.add_multi * game.producers[self.grandma_producer].n_owned / self.per_n
+        factors[self.add_producer] = factors.get(self.add_producer, 1) * bonus
+        
+        production = sum(game.producers[p].production * (f - 1) for p, f in factors.items())
+        d_cpt = production * game.get_multi()
+        return d_cpt, game._cpc_delta(d_cpt)
+        
+    def affected_producers(self):
+        return (self.grandma_producer, self.add_producer)
+        
+    def get_multiplier_producer(self, game):
+        return 1 + self.add_multi * game.producers[self.grandma_producer].n_owned / self.per_n
         
     def get_multiplier_grandma(self):
         return self.grandma_multi
         
-        
-    def __str__(self):
+    def format(self, game):
         parts = [
             super().__str__(),
             ", ".join([
                 f"{int(self.get_multiplier_grandma()):d}",
-                f"{self.get_multiplier_producer():.2f}",
+                f"{self.get_multiplier_producer(game):.2f}",
             ])
         ]
         
         return "".join(parts)
 
 
+class Event:
+    """
+    Something that happens to a game at a given turn, see CookieClickerGame.schedule().
+    Events are shared between clones and snapshots, so they mustn't hold per-game state.
+    
+    """
+    __slots__ = ()
+    
+    recurring = False # reschedules itself forever
+    
+    def fire(self, game):
+        pass
+        
+class UpgradeUpdate(Event):
+    __slots__ = ("upgrade",)
+    
+    recurring = True
+    
+    def __init__(self, upgrade):
+        self.upgrade = upgrade
+        
+    def fire(self, game):
+        self.upgrade.update(game)
+        game.invalidate()
+        game.schedule(game.turn + self.upgrade.period, self)
+        
+class BuffStart(Event):
+    __slots__ = ("buff", "duration")
+    
+    def __init__(self, buff, duration):
+        self.buff = buff
+        self.duration = duration
+        
+    def fire(self, game):
+        game._set_buffs(game.buffs + (self.buff,))
+        game.schedule(game.turn + self.duration, BuffEnd(self.buff))
+        
+class BuffEnd(Event):
+    __slots__ = ("buff",)
+    
+    def __init__(self, buff):
+        self.buff = buff
+        
+    def fire(self, game):
+        buffs = list(game.buffs)
+        buffs.remove(self.buff)
+        game._set_buffs(tuple(buffs))
+        
+
+class Buff:
+    """
+    Temporary multiplier on production and/or clicks, active between a BuffStart and its BuffEnd
+    (see CookieClickerGame.add_buff). Active buffs stack multiplicatively.
+    
+    """
+    __slots__ = ("name", "multiplier", "click_multiplier")
+    
+    def __init__(self, name, multiplier=1, click_multiplier=1):
+        self.name = name
+        self.multiplier = multiplier
+        self.click_multiplier = click_multiplier
+        
+    def __repr__(self):
+        return f"Buff({self.name!r}, {self.multiplier}, {self.click_multiplier})"
+        
+FRENZY = Buff("frenzy", multiplier=7)
+CLICK_FRENZY = Buff("click_frenzy", click_multiplier=777)
+
+
+class ProducerSpec:
+    __slots__ = ("name", "cpt", "base_price", "price_scaling", "prices", "cumulative")
+    
+    def __init__(self, name, cpt, base_price, price_scaling):
+        self.name = name
+        self.cpt = cpt # cookies per turn
+        self.base_price = base_price
+        self.price_scaling = price_scaling
+        
+        # Price table, grown on demand: prices[n] is the price of the (n+1)th building,
+        # cumulative[n] what the first n cost together
+        self.prices = []
+        self.cumulative = [0]
+        
+    def _extend_table(self, n):
+        prices, cumulative = self.prices, self.cumulative
+        while len(prices) <= n:
+            price = int(self.base_price * self.price_scaling ** len(prices))
+            prices.append(price)
+            cumulative.append(cumulative[-1] + price)
+        
+    def get_price(self, n):
+        if n >= len(self.prices):
+            self._extend_table(n)
+            
+        return self.prices[n]
+        
+    def get_bulk_price(self, n, count):
+        """Cost of buying count buildings when n are already owned."""
+        if n + count >= len(self.cumulative):
+            self._extend_table(n + count)
+            
+        return self.cumulative[n + count] - self.cumulative[n]
+        
+    def get_max_affordable(self, n, cookies):
+        """Most buildings that can be bought with cookies when n are already owned."""
+        # Size the table from the geometric series base * s^n * (s^count - 1) / (s - 1),
+        # the int rounding of each price only makes the real total cheaper
+        s = self.price_scaling
+        estimate = math.log(cookies * (s - 1) / (self.base_price * s ** n) + 1, s) if cookies > 0 else 0
+        self._extend_table(n + int(estimate) + 1)
+        
+        budget = self.cumulative[n] + cookies
+        while self.cumulative[-1] <= budget:
+            self._extend_table(2 * len(self.prices))
+            
+        return bisect.bisect_right(self.cumulative, budget, lo=n) - 1 - n
+        
+
+class Catalog:
+    """
+    Immutable producer/upgrade definitions compiled from producer_spec / upgrade_spec.
+    Built once per game class and shared by every instance.
+    
+    """
+    __slots__ = ("producers", "upgrades", "producer_index", "cursor", "grandma", "update_upgrades", "upgrades_by_cost", "actions")
+    
+    def __init__(self, producer_spec, upgrade_spec):
+        self.producers = tuple(ProducerSpec(*spec) for spec in producer_spec)
+        self.producer_index = {p.name: i for i, p in enumerate(self.producers)}
+        self.cursor = self.producer_index["cursor"]
+        self.grandma = self.producer_index["grandma"]
+        
+        upgrades = []
+        for i, spec in enumerate(upgrade_spec):
+            kwargs = {k: v for k, v in spec.items() if k != "type"}
+            
+            if "producer" in kwargs:
+                kwargs["producer"] = self.producer_index[kwargs["producer"]]
+                
+            if "producers" in kwargs:
+                kwargs["producers"] = [self.producer_index[p] for p in kwargs["producers"]]
+                
+            if "cursor_producer" in kwargs:
+                kwargs["cursor_producer"] = self.producer_index[kwargs["cursor_producer"]]
+                
+            if spec["type"] in (CursorAddPerOtherUpgrade,):
+                kwargs["cursor_producer"] = self.cursor
+                
+            if spec["type"] in (ProducerMultiPerNGrandmasUpgrade,):
+                kwargs["grandma_producer"] = self.grandma
+            
+            upgrade = spec["type"](**kwargs)
+            upgrade.idx = i
+            upgrades.append(upgrade)
+            
+        self.upgrades = tuple(upgrades)
+        self.update_upgrades = tuple(u for u in self.upgrades if isinstance(u, UpdateUpgrade))
+        self.upgrades_by_cost = tuple(sorted((u.cost, u.idx) for u in self.upgrades))
+        
+        # Flat action layout, same order as CookieClickerGame.get_all_actions(): (method name, argument)
+        self.actions = (
+            (("click", None),)
+            + tuple(("buy_producer", i) for i in range(len(self.producers)))
+            + tuple(("sell_producer", i) for i in range(len(self.producers)))
+            + tuple(("buy_upgrade", i) for i in range(len(self.upgrades)))
+        )
+        
+        
+class AffordableView:
+    """
+    Indices of the first n entries of a cost-sorted (cost, idx) list.
+    Only valid until the game it came from next buys or sells something.
+    
+    """
+    __slots__ = ("entries", "n")
+    
+    def __init__(self, entries, n):
+        self.entries = entries
+        self.n = n
+        
+    def __len__(self):
+        return self.n
+        
+    def __getitem__(self, i):
+        if not -self.n <= i < self.n:
+            raise IndexError(i)
+            
+        return self.entries[i % self.n][1]
+        
+    def __iter__(self):
+        entries = self.entries
+        for i in range(self.n):
+            yield entries[i][1]
+
+
+class GameSnapshot(namedtuple("GameSnapshot", [
+    "producer_counts", "upgrade_mask", "turn", "cpt",
+    "base_turn", "cookies_base", "total_base", "rate", "prod_rate",
+    "events", "buffs", "effects",
+], defaults=(None, (), None))):
+    """
+    State returned by CookieClickerGame.snapshot(). The cookie fields are the game's lazy
+    base + rate accounting, kept as-is so a restored game continues bit-for-bit.
+    events / buffs: the pending event queue and active buffs (not kept by savestate records).
+            events None means rebuild the queue from the holdings: restore() keeps whatever
+            re-buying the upgrades schedules, such as UpdateUpgrade's recurring updates (a
+            period after the snapshot's turn if it has effects, which already include that
+            turn's update). An empty tuple is an empty queue.
+    effects: the compiled upgrade effect scalars, see CookieClickerGame.get_effects(). With them
+             a restored game gets exactly the original's products, including whatever recurring
+             update() events have added. Without them (None) they are rebuilt from
+             upgrade_mask in catalog order, which can differ in the last bits.
+    
+    """
+    __slots__ = ()
+    
+    @property
+    def cookies(self):
+        return self.cookies_base + self.rate * (self.turn - self.base_turn)
+        
+    @property
+    def total_cookies(self):
+        return self.total_base + self.prod_rate * (self.turn - self.base_turn)
+
+
+MarginalGain = namedtuple("MarginalGain", ["kind", "idx", "cost", "d_cpt", "d_cpc", "payback"])
+MarginalGain.__doc__ = """
+Effect of one candidate purchase, see CookieClickerGame.marginal_gains().
+kind, idx: the purchase as a Catalog.actions entry ("buy_producer" / "buy_upgrade", index)
+payback: turns of the added income to earn back cost, inf if it adds nothing
+"""
+
+
 class CookieClickerGame:
     producer_spec = [
         # name, production, cost, price_scaling
@@ -488,84 +826,427 @@ class CookieClickerGame:
         dict(type=ProducerMultiplierUpgrade, name="chocolate_ouroboros", cost=155e27, producer="fractal_engine", multiplier=2),
     ]
 
-    def __init__(self, verbose=True):
+    @classmethod
+    def get_catalog(cls):
+        """Compile the spec tables on first use, then reuse them for every game of this class."""
+        catalog = cls.__dict__.get("_catalog")
+        if catalog is None:
+            catalog = Catalog(cls.producer_spec, cls.upgrade_spec)
+            cls._catalog = catalog
+            
+        return catalog
+
+    def __init__(self, verbose=True, seed=None):
         self.verbose=verbose
+        self.catalog = self.get_catalog()
+        self.rng = random
+        self.producers = [Producer(spec) for spec in self.catalog.producers]
+        
+        self.reset(seed=seed)
+        
+    def reset(self, cookies=0, seed=None):
+        """
+        Restore the starting state in place, reusing the producer objects.
+        seed: reseed the game's own random generator. Without one it keeps the current generator
+              (the shared random module unless the game was created with a seed).
+        
+        """
+        if seed is not None:
+            self.rng = random.Random(seed)
     
-        self.total_cookies = 0
-        self.cookies = 0
         self.turn = 0
         self.cpt = 0
-        self.multiplier_funcs = []
-        self.clicker_add_funcs = []
-        self.clicker_multiplier_funcs = []
         
+        # cookies / total_cookies are kept as a base plus a constant rate since _base_turn,
+        # so idle turns only move the turn counter (see advance)
+        self._base_turn = 0
+        self._cookies_base = cookies
+        self._total_base = 0
+        self._rate = 0 # cookies per turn, production plus clicks
+        self._prod_rate = 0 # total_cookies per turn
+        
+        # Compiled upgrade effects. Constant multipliers are folded in at purchase time,
+        # only the count-dependent terms are evaluated in get_cpt / get_cpc.
+        self.multiplier = 1
+        self.clicker_multiplier = 1
+        self.clicker_add_per_other = 0 # per non-cursor building
+        self.clicker_cps_add = 0 # fraction of cpt added to each click
+        
+        # Timed effects: heap of (turn, seq, Event), and the active buffs' combined multipliers
+        self.events = []
+        self._event_seq = 0
+        self.buffs = ()
+        self.buff_multiplier = 1
+        self.buff_click_multiplier = 1
+        
+        # Cached production, cleared by invalidate() whenever a purchase changes what it depends on
+        self._cpt_cache = None
+        self._cpc_cache = None
+        self._n_others_cache = None
         
-        self.producers = self._setup_producers()
-        self.upgrades = self._setup_upgrades()
+        for p in self.producers:
+            p.reset()
+        self.upgrade_mask = 0 # bit i set when upgrades[i] is owned
         
-    def _setup_producers(self):
-        return [Producer(*spec) for spec in self.producer_spec]
+        # (price, idx) of every producer and of the unowned upgrades, cheapest first
+        self.producers_by_price = sorted((p.current_price, i) for i, p in enumerate(self.producers))
+        self.upgrades_by_cost = list(self.catalog.upgrades_by_cost)
         
-    def _setup_upgrades(self):
-        upgrades = []
-        for spec in self.upgrade_spec:
-            spec = copy.copy(spec)
+        return self
         
-            if "producer" in spec:
-                spec["producer"] = self.get_producer(spec["producer"])
-                
-            if "cursor_producer" in spec:
-                spec["cursor_producer"] = self.get_producer(spec["cursor_producer"])
-                
+    def snapshot(self):
+        """Compact, hashable copy of the game state. Bring it back with restore()."""
+        return GameSnapshot(
+            tuple(p.n_owned for p in self.producers), self.upgrade_mask, self.turn, self.cpt,
+            self._base_turn, self._cookies_base, self._total_base, self._rate, self._prod_rate,
+            tuple(self.events), self.buffs, self.get_effects(),
+        )
+        
+    def get_effects(self):
+        """
+        The compiled upgrade effect scalars as a flat tuple: multiplier, clicker_multiplier,
+        clicker_add_per_other, clicker_cps_add, then multiplier, add_pre, add_per_other of
+        each producer. (grandma_bonuses are kept in catalog order, so the mask determines them.)
+        
+        """
+        effects = [self.multiplier, self.clicker_multiplier, self.clicker_add_per_other, self.clicker_cps_add]
+        for p in self.producers:
+            effects += (p.multiplier, p.add_pre, p.add_per_other)
             
-            if spec["type"] in (CursorAddPerOtherUpgrade,):
-                spec["producers"] = self.producers
-                
-            if spec["type"] in (GameMultiplierUpgrade, CursorAddPerOtherUpgrade, ClickerAddCPSUpgrade, ClickerCursorMultiplierUpgrade):
-                spec["game"] = self
-                
-            if spec["type"] in (ProducerMultiPerNGrandmasUpgrade,):
-                spec["grandma_producer"] = self.get_producer("grandma")
+        return tuple(effects)
+        
+    def set_effects(self, effects):
+        """Put back scalars from get_effects(). Call invalidate() afterwards."""
+        self.multiplier, self.clicker_multiplier, self.clicker_add_per_other, self.clicker_cps_add = effects[:4]
+        for i, p in enumerate(self.producers):
+            p.multiplier, p.add_pre, p.add_per_other = effects[4 + 3 * i:7 + 3 * i]
+        
+    def restore(self, snapshot):
+        """
+        Put the game back into a state from snapshot(). Upgrade effects are rebuilt by re-buying
+        the owned upgrades in catalog order, then overwritten by the snapshot's effects if it has
+        them (see GameSnapshot).
+        
+        """
+        (counts, self.upgrade_mask, self.turn, self.cpt,
+         self._base_turn, self._cookies_base, self._total_base, self._rate, self._prod_rate,
+         events, buffs, effects) = snapshot
+         
+        self.multiplier = 1
+        self.clicker_multiplier = 1
+        self.clicker_add_per_other = 0
+        self.clicker_cps_add = 0
+        
+        for p, n in zip(self.producers, counts):
+            p.reset(n)
+            
+        self.events = []
+        self._event_seq = 0
+        mask = self.upgrade_mask
+        upgrades = self.catalog.upgrades
+        while mask:
+            low = mask & -mask
+            upgrades[low.bit_length() - 1].buy(self)
+            mask ^= low
             
-            upgrades.append(spec["type"](**{k:v for k,v in spec.items() if k != "type"}))
+        if effects is not None:
+            self.set_effects(effects)
             
-        return upgrades
+        # The snapshot's queue already holds whatever the re-buys scheduled
+        if events is not None:
+            self.events = list(events)
+            self._event_seq = max((seq for _, seq, _ in events), default=-1) + 1
+        elif effects is not None:
+            # The snapshot's effects already include any update due this turn, so the rebuilt
+            # recurring updates resume a period later
+            self.events = [
+                (t + e.upgrade.period if isinstance(e, UpgradeUpdate) else t, seq, e)
+                for t, seq, e in self.events
+            ]
+            heapq.heapify(self.events)
+        self._set_buffs(buffs)
+        
+        self.producers_by_price = sorted((p.current_price, i) for i, p in enumerate(self.producers))
+        mask = self.upgrade_mask
+        self.upgrades_by_cost = [e for e in self.catalog.upgrades_by_cost if not (mask >> e[1]) & 1]
+        
+        return self
+        
+    def clone(self):
+        """Independent copy of this game. Shares the catalog and the random generator."""
+        other = self.__class__.__new__(self.__class__)
+        other.__dict__.update(self.__dict__)
+        
+        other.producers = [p.copy() for p in self.producers]
+        other.producers_by_price = list(self.producers_by_price)
+        other.upgrades_by_cost = list(self.upgrades_by_cost)
+        other.events = list(self.events)
+        
+        return other
+        
+    @property
+    def upgrades(self):
+        return self.catalog.upgrades
+        
+    def owns_upgrade(self, idx):
+        return (self.upgrade_mask >> int(idx)) & 1 == 1
     
-    def _update_upgrades(self):
-        for upgr in self.upgrades:
-            if issubclass(upgr.__class__, UpdateUpgrade):
-                upgr.update()
+    def schedule(self, turn, event):
+        """
+        Fire event (see Event) when the game reaches turn. Events that are already due fire
+        at the start of the next advance(), before any production.
+        
+        """
+        heapq.heappush(self.events, (turn, self._event_seq, event))
+        self._event_seq += 1
+        
+    def add_buff(self, buff, duration, turn=None):
+        """Make buff active for duration turns, starting at turn (default now, right away)."""
+        self.schedule(self.turn if turn is None else turn, BuffStart(buff, duration))
+        self._fire_due()
+        
+    def _set_buffs(self, buffs):
+        self.buffs = buffs
+        self.buff_multiplier = math.prod(b.multiplier for b in buffs)
+        self.buff_click_multiplier = math.prod(b.click_multiplier for b in buffs)
+        self.invalidate()
+        
+    def _fire_due(self):
+        events = self.events
+        while events and events[0][0] <= self.turn:
+            heapq.heappop(events)[2].fire(self)
     
+    def invalidate(self):
+        """
+        Drop the cached production. Called after anything that changes producer counts or owned upgrades.
+        
+        """
+        self._cpt_cache = None
+        self._cpc_cache = None
+        self._n_others_cache = None
     
     def get_cpt(self):
-        return sum(p.get_production() for p in self.producers) * self.get_multi()
+        if self._cpt_cache is None:
+            n_grandmas = self.producers[self.catalog.grandma].n_owned
+            n_others = self.get_n_others()
+            
+            total = 0
+            for p in self.producers:
+                p.production = p.get_production(n_grandmas, n_others)
+                total += p.production
+            
+            self._cpt_cache = total * self.get_multi()
+            
+        return self._cpt_cache
+        
+    def get_n_others(self):
+        """Number of non-cursor buildings owned."""
+        if self._n_others_cache is None:
+            self._n_others_cache = sum(p.n_owned for p in self.producers) - self.producers[self.catalog.cursor].n_owned
+            
+        return self._n_others_cache
         
     def get_producer(self, name):
-        return next(p for p in self.producers if p.name == name)
+        return self.producers[self.catalog.producer_index[name]]
         
     def get_multi(self):
-        return prod(f() for f in self.multiplier_funcs)
+        return self.multiplier * self.buff_multiplier
     
-    def advance(self):
-        self._update_upgrades()
+    @property
+    def cookies(self):
+        return self._cookies_base + self._rate * (self.turn - self._base_turn)
+        
+    @cookies.setter
+    def cookies(self, value):
+        self._rebase()
+        self._cookies_base = value
+        
+    @property
+    def total_cookies(self):
+        return self._total_base + self._prod_rate * (self.turn - self._base_turn)
+        
+    @total_cookies.setter
+    def total_cookies(self, value):
+        self._rebase()
+        self._total_base = value
+        
+    def _rebase(self):
+        if self.turn != self._base_turn:
+            self._cookies_base = self.cookies
+            self._total_base = self.total_cookies
+            self._base_turn = self.turn
     
+    def advance(self, n_turns=1, clicks_per_turn=0):
+        """
+        Move n_turns forward, clicking clicks_per_turn times in each.
+        Gives exactly the same cookies, total_cookies, turn and cpt as n_turns calls of advance(1),
+        but while nothing is bought it costs O(1) instead of O(n_turns), plus O(log n) per
+        scheduled event on the way: the jump is split at each event's turn, where it fires.
+        
+        """
+        end = self.turn + n_turns
+        self._fire_due()
+        while self.turn < end:
+            step = end - self.turn
+            if self.events:
+                step = min(step, self.events[0][0] - self.turn)
+            self._advance(step, clicks_per_turn)
+            self._fire_due()
+            
+    def _advance(self, n_turns, clicks_per_turn):
         self.cpt = self.get_cpt()
-        self.cookies += self.cpt
-        self.total_cookies += self.cpt
-        self.turn += 1
+        rate = self.cpt + clicks_per_turn * self.get_cpc() if clicks_per_turn else self.cpt
+        
+        if rate != self._rate or self.cpt != self._prod_rate:
+            self._rebase()
+            self._rate = rate
+            self._prod_rate = self.cpt
+            
+        self.turn += n_turns
+        
+    def get_cost(self, target):
+        """Price of target: a Producer, an Upgrade or a plain number of cookies."""
+        if isinstance(target, Producer):
+            return target.current_price
+        if isinstance(target, Upgrade):
+            return target.cost
+            
+        return target
+        
+    def _cookies_after(self, n_turns, rate):
+        # What advance(n_turns) would leave in self.cookies at this rate
+        if rate == self._rate and self.get_cpt() == self._prod_rate:
+            return self._cookies_base + rate * (self.turn + n_turns - self._base_turn)
+            
+        return self.cookies + rate * n_turns
+        
+    def _total_after(self, n_turns, rate):
+        # What advance(n_turns) would leave in self.total_cookies, cookies going up at rate
+        cpt = self.get_cpt()
+        if rate == self._rate and cpt == self._prod_rate:
+            return self._total_base + cpt * (self.turn + n_turns - self._base_turn)
+            
+        return self.total_cookies + cpt * n_turns
+        
+    def _first_turn(self, value_after, goal, estimate):
+        # First n with value_after(n) >= goal, for value_after increasing in n and > goal at some n.
+        # The estimate can be off by float rounding; bracket the answer around it
+        # (lo never reaching goal, hi reaching it) and bisect
+        hi = max(1, estimate)
+        step = 1
+        while value_after(hi) < goal:
+            hi += step
+            step *= 2
+        
+        lo = hi - 1
+        step = 1
+        while lo > 0 and value_after(lo) >= goal:
+            hi = lo
+            lo = max(0, lo - step)
+            step *= 2
+            
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if value_after(mid) >= goal:
+                hi = mid
+            else:
+                lo = mid
+            
+        return hi
+        
+    def _turns_until(self, wait, goal, clicks_per_turn):
+        # wait(game, goal, clicks_per_turn): turns until goal at game's current production.
+        # Production only changes at scheduled events, so wait for each stretch between them
+        # in turn, stepping a copy of the game across the events on the way
+        n_turns = wait(self, goal, clicks_per_turn)
+        events = self.events
+        if not events or (n_turns is not None and n_turns <= events[0][0] - self.turn):
+            return n_turns
+            
+        game = self.clone()
+        game.verbose = False
+        while True:
+            n_turns = wait(game, goal, clicks_per_turn)
+            events = game.events
+            if not events:
+                return None if n_turns is None else game.turn - self.turn + n_turns
+            
+            step = events[0][0] - game.turn
+            if n_turns is not None and n_turns <= step:
+                return game.turn - self.turn + n_turns
+            if n_turns is None and all(e.recurring for _, _, e in events):
+                return None # assumed not to start production by themselves
+                
+            game.advance(step, clicks_per_turn)
+        
+    def turns_until_affordable(self, target, clicks_per_turn=0):
+        """
+        Number of turns of advance(n, clicks_per_turn) until target (see get_cost) can be bought,
+        with no purchases in between. None if it never will be.
+        
+        """
+        return self._turns_until(CookieClickerGame._affordable_in, self.get_cost(target), clicks_per_turn)
+        
+    def _affordable_in(self, cost, clicks_per_turn):
+        # turns_until_affordable at the current production, ignoring scheduled events
+        if cost <= self.cookies:
+            return 0
+            
+        rate = self.get_cpt() + clicks_per_turn * self.get_cpc() if clicks_per_turn else self.get_cpt()
+        if rate <= 0:
+            return None
+            
+        estimate = math.ceil((cost - self.cookies) / rate)
+        return self._first_turn(lambda n: self._cookies_after(n, rate), cost, estimate)
+        
+    def turns_until_total(self, amount, clicks_per_turn=0):
+        """
+        Number of turns of advance(n, clicks_per_turn) until total_cookies reaches amount, with
+        no purchases in between. None if it never will. Clicks don't count towards total_cookies.
+        
+        """
+        return self._turns_until(CookieClickerGame._total_in, amount, clicks_per_turn)
+        
+    def _total_in(self, amount, clicks_per_turn):
+        if amount <= self.total_cookies:
+            return 0
+            
+        cpt = self.get_cpt()
+        if cpt <= 0:
+            return None
+            
+        rate = cpt + clicks_per_turn * self.get_cpc() if clicks_per_turn else cpt
+        estimate = math.ceil((amount - self.total_cookies) / cpt)
+        return self._first_turn(lambda n: self._total_after(n, rate), amount, estimate)
+        
+    def advance_until(self, target, clicks_per_turn=0):
+        """
+        Jump straight to the first turn target is affordable.
+        Returns the number of turns advanced, or None (without advancing) if it never will be.
+        
+        """
+        n_turns = self.turns_until_affordable(target, clicks_per_turn)
+        if n_turns is not None:
+            self.advance(n_turns, clicks_per_turn)
+            
+        return n_turns
         
     def buy_upgrade(self, idx):
+        idx = int(idx) # numpy integers would overflow the ownership bitmap
         upgrade = self.upgrades[idx]
         cost = upgrade.cost
         
-        if upgrade.owned:
+        if self.owns_upgrade(idx):
             if self.verbose: print(f"Upgrade: {upgrade.name} already owned.")
             return False
         
         if cost <= self.cookies:
             if self.verbose: print(f"Bought: {upgrade.name} for {upgrade.cost}. Cookies: {self.cookies} -> ", end="")
             self.cookies -= cost
-            upgrade.buy()
+            upgrade.buy(self)
+            self.upgrade_mask |= 1 << idx
+            del self.upgrades_by_cost[bisect.bisect_left(self.upgrades_by_cost, (cost, idx))]
+            self.invalidate()
             if self.verbose: print(f"{self.cookies:.1f}")
             
             return True
@@ -573,38 +1254,154 @@ class CookieClickerGame:
             if self.verbose: print(f"Cant afford upgrade: {upgrade.name} for {upgrade.cost:.0f} with {self.cookies:.1f}")
             return False
         
-    def buy_producer(self, idx):
+    def buy_producer(self, idx, count=1):
         prod = self.producers[idx]
-        cost = prod.current_price
+        if count < 1:
+            if self.verbose: print(f"Cant buy: {count} x {prod.name}")
+            return False
+            
+        cost = prod.current_price if count == 1 else prod.spec.get_bulk_price(prod.n_owned, count)
         if cost <= self.cookies:
-            if self.verbose: print(f"Bought: {prod.name} for {prod.current_price}. Cookies: {self.cookies} -> ", end="")
+            if self.verbose: print(f"Bought: {count} x {prod.name} for {cost}. Cookies: {self.cookies} -> ", end="")
             self.cookies -= cost
-            prod.buy()
+            self._unindex_producer(idx)
+            prod.buy(count)
+            self._index_producer(idx)
+            self.invalidate()
             if self.verbose: print(f"{self.cookies:.1f}")
             
             return True
         else:
-            if self.verbose: print(f"Cant afford producer: {prod.name} for {prod.current_price:.0f} with {self.cookies:.1f}")
+            if self.verbose: print(f"Cant afford producer: {count} x {prod.name} for {cost:.0f} with {self.cookies:.1f}")
             return False
             
-    def sell_producer(self, idx):
+    def sell_producer(self, idx, count=1):
         prod = self.producers[idx]
         
-        if prod.n_owned > 0:
+        if 1 <= count <= prod.n_owned:
             
             _cookies = self.cookies
-            prod.sell()
-            self.cookies += prod.current_price
-            if self.verbose: print("Sold:", prod.name, "for", prod.current_price, ". Cookies:", _cookies, "->", self.cookies)
+            self._unindex_producer(idx)
+            prod.sell(count)
+            self._index_producer(idx)
+            self.invalidate()
+            refund = prod.current_price if count == 1 else prod.spec.get_bulk_price(prod.n_owned, count)
+            self.cookies += refund
+            if self.verbose: print("Sold:", count, "x", prod.name, "for", refund, ". Cookies:", _cookies, "->", self.cookies)
             
             return True
         
         else:
-            if self.verbose: print(f"Cant sell: {prod.name}. Owned: {prod.n_owned}")
+            if self.verbose: print(f"Cant sell: {count} x {prod.name}. Owned: {prod.n_owned}")
             return False
             
+    def _unindex_producer(self, idx):
+        entries = self.producers_by_price
+        del entries[bisect.bisect_left(entries, (self.producers[idx].current_price, idx))]
+        
+    def _index_producer(self, idx):
+        bisect.insort(self.producers_by_price, (self.producers[idx].current_price, idx))
+        
+    def affordable_producers(self):
+        """Indices of the producers the current cookies can buy, cheapest first."""
+        entries = self.producers_by_price
+        return AffordableView(entries, bisect.bisect_right(entries, (self.cookies, math.inf)))
+        
+    def affordable_upgrades(self):
+        """Indices of the unowned upgrades the current cookies can buy, cheapest first."""
+        entries = self.upgrades_by_cost
+        return AffordableView(entries, bisect.bisect_right(entries, (self.cookies, math.inf)))
+        
+    def owned_producers(self):
+        return [i for i, p in enumerate(self.producers) if p.n_owned > 0]
+        
+    def max_affordable(self, idx):
+        """How many of producer idx the current cookies can buy in one buy_producer(idx, count)."""
+        prod = self.producers[idx]
+        return prod.spec.get_max_affordable(prod.n_owned, self.cookies)
+            
     def get_cpc(self):
-        return (1 + sum(f() for f in self.clicker_add_funcs)) * prod(f() for f in self.clicker_multiplier_funcs)
+        if self._cpc_cache is None:
+            add = 1 + self.clicker_add_per_other * self.get_n_others() + self.get_cpt() * self.clicker_cps_add
+            self._cpc_cache = add * self.clicker_multiplier * self.buff_click_multiplier
+            
+        return self._cpc_cache
+        
+    def _cpc_delta(self, d_cpt, n_others=None, clicker_add_per_other=None, clicker_cps_add=None, clicker_multiplier=None):
+        # Change in get_cpc() if cpt moved by d_cpt and the given click terms took new values
+        if n_others is None and clicker_add_per_other is None and clicker_cps_add is None and clicker_multiplier is None:
+            return d_cpt * self.clicker_cps_add * self.clicker_multiplier * self.buff_click_multiplier
+
+        n_others = self.get_n_others() if n_others is None else n_others
+        add_per_other = self.clicker_add_per_other if clicker_add_per_other is None else clicker_add_per_other
+        cps_add = self.clicker_cps_add if clicker_cps_add is None else clicker_cps_add
+        multiplier = self.clicker_multiplier if clicker_multiplier is None else clicker_multiplier
+        
+        cpc = (1 + add_per_other * n_others + (self.get_cpt() + d_cpt) * cps_add) * multiplier * self.buff_click_multiplier
+        return cpc - self.get_cpc()
+        
+    def producer_gain(self, idx):
+        """
+        (d_cpt, d_cpc) buying one more of producer idx would cause. Besides its own production
+        this counts the buildings that scale with it: per-other adds (cursors) when it isn't a
+        cursor, and grandma bonuses when it is a grandma.
+        
+        """
+        catalog = self.catalog
+        cpt = self.get_cpt()
+        n_grandmas = self.producers[catalog.grandma].n_owned
+        n_others = self.get_n_others()
+        
+        new_grandmas = n_grandmas + (idx == catalog.grandma)
+        new_others = n_others + (idx != catalog.cursor)
+        
+        # Only these producers' terms can change
+        changed = {idx}
+        if new_others != n_others:
+            changed.update(q for q, p in enumerate(self.producers) if p.add_per_other)
+        if new_grandmas != n_grandmas:
+            changed.update(q for q, p in enumerate(self.producers) if p.grandma_bonuses)
+        
+        production = 0
+        for q in changed:
+            p = self.producers[q]
+            n_owned = p.n_owned + (q == idx)
+            production += p.get_production(new_grandmas, new_others, n_owned) - p.production
+            
+        d_cpt = production * self.get_multi()
+        return d_cpt, self._cpc_delta(d_cpt, n_others=new_others)
+        
+    def upgrade_gain(self, idx):
+        """(d_cpt, d_cpc) buying upgrade idx would cause."""
+        self.get_cpt()
+        return self.upgrades[int(idx)].marginal_gain(self)
+        
+    def _marginal_gain(self, kind, idx, cost, gain, clicks_per_turn):
+        d_cpt, d_cpc = gain
+        income = d_cpt + clicks_per_turn * d_cpc
+        payback = cost / income if income > 0 else math.inf
+        return MarginalGain(kind, idx, cost, d_cpt, d_cpc, payback)
+        
+    def marginal_gains(self, clicks_per_turn=0, max_cost=math.inf):
+        """
+        MarginalGain of buying one of every producer and every unowned upgrade, computed from
+        the current effects without buying anything.
+        clicks_per_turn: clicks counted towards the added income when computing payback.
+        max_cost: leave out anything more expensive.
+        
+        """
+        self.get_cpt()
+        gains = [
+            self._marginal_gain("buy_producer", i, p.current_price, self.producer_gain(i), clicks_per_turn)
+            for i, p in enumerate(self.producers) if p.current_price <= max_cost
+        ]
+        upgrades = self.upgrades_by_cost
+        gains.extend(
+            self._marginal_gain("buy_upgrade", i, cost, self.upgrades[i].marginal_gain(self), clicks_per_turn)
+            for cost, i in upgrades[:bisect.bisect_right(upgrades, (max_cost, math.inf))]
+        )
+        
+        return gains
     
     def click(self):
         self.cookies += self.get_cpc()
@@ -619,13 +1416,13 @@ class CookieClickerGame:
     def str_basic(self):
         return "\n".join([
             f"Turn: {self.turn}, Cookies: {format_large_num(self.cookies)}, Producing: {format_large_num(self.cpt)}, Total: {format_large_num(self.total_cookies)}",
-            f"Cookies/click: {format_large_num(self.get_cpc())}, ClickerMultis: {str([f() for f in self.clicker_multiplier_funcs])}",
+            f"Cookies/click: {format_large_num(self.get_cpc())}, ClickerMulti: {format_large_num(self.clicker_multiplier)}",
         ])
     
     def str_producers(self):
         return "\n".join([
             "Producers:",
-            f"{'Name':<25s}{'Owned':<10s}{'Cost':<15s}{'Producing':<20s}{'Multis':<20s}",
+            f"{'Name':<25s}{'Owned':<10s}{'Cost':<15s}{'Producing':<20s}{'Multi':<20s}",
             "\n".join(map(str, self.producers)),
         ])
         
@@ -633,31 +1430,55 @@ class CookieClickerGame:
         return "\n".join([
             "Upgrades:",
             f"{'Name':<40s}{'Type':<35s}{'Multi':<10s}",
-            "\n".join(str(u) for u in self.upgrades if u.owned),
+            "\n".join(u.format(self) for u in self.upgrades if self.owns_upgrade(u.idx)),
         ])
         
         
     def get_available_actions(self):
-        def _pass():
-            pass
-    
         actions = []
         
-        # actions.append([_pass])
-        
         actions.append([self.click])
         
-        avail_buy_prod = [(i,) for i, p in enumerate(self.producers) if p.current_price <= self.cookies]
+        avail_buy_prod = [(i,) for i in self.affordable_producers()]
         actions.append([self.buy_producer, avail_buy_prod])
         
-        avail_sell_prod = [(i,) for i, p in enumerate(self.producers) if p.n_owned > 0]
+        avail_sell_prod = [(i,) for i in self.owned_producers()]
         actions.append([self.sell_producer, avail_sell_prod])
         
-        avail_buy_upgr = [(i,) for i, u in enumerate(self.upgrades) if not u.owned and u.cost <= self.cookies]
+        avail_buy_upgr = [(i,) for i in self.affordable_upgrades()]
         actions.append([self.buy_upgrade, avail_buy_upgr])
             
         return actions
        
+    def fill_action_mask(self, out):
+        """
+        Write which flat actions (see Catalog.actions) are legal right now into out, a writable
+        array of len(catalog.actions) such as a NumPy bool array. Returns out.
+        
+        """
+        P = len(self.producers)
+        
+        out[:] = False
+        out[0] = True
+        for p in self.affordable_producers():
+            out[1 + p] = True
+        for p, producer in enumerate(self.producers):
+            if producer.n_owned > 0:
+                out[1 + P + p] = True
+        for u in self.affordable_upgrades():
+            out[1 + 2 * P + u] = True
+            
+        return out
+        
+    def do_action(self, action):
+        """Perform flat action index action (see Catalog.actions). Returns whether it succeeded."""
+        kind, target = self.catalog.actions[action]
+        if target is None:
+            getattr(self, kind)()
+            return True
+            
+        return getattr(self, kind)(target)
+        
     def get_all_actions(self):
         def _pass():
             pass
@@ -684,89 +1505,137 @@ class CookieClickerGame:
     
     def random_action(self, weights=None):
         """
-        weights: [pass, click, buy_prod, sell_prod, buy_upgr]
+        weights: [click, buy_prod, sell_prod, buy_upgr]. Kinds with nothing available are skipped.
         
         """
-    
-        def update_weights(weights):
-            if weights is None:
-                weights = [1, 1, 1, 1, 1]
-        
-            for i, action in enumerate(avail_actions):
-                if len(action) > 1 and len(action[1]) == 0:
-                    weights[i] = 0
+        if weights is None:
+            weights = [1, 1, 1, 1]
             
-            return weights
-
-
-            
-    
-        avail_actions = self.get_available_actions()
-        weights = update_weights(weights)
-        
-        action = random.choices(avail_actions, weights, k=1)[0]
-        if len(action) == 1:
-            action[0]()
+        buy_prod = self.affordable_producers()
+        n_sell = sum(1 for p in self.producers if p.n_owned > 0)
+        buy_upgr = self.affordable_upgrades()
+        
+        counts = (1, len(buy_prod), n_sell, len(buy_upgr))
+        weights = [w if n else 0 for w, n in zip(weights, counts)]
+        kind = self.rng.choices(range(4), weights, k=1)[0]
+        
+        if kind == 0:
+            self.click()
+        elif kind == 1:
+            self.buy_producer(self.rng.choice(buy_prod))
+        elif kind == 2:
+            self.sell_producer(self.rng.choice(self.owned_producers()))
         else:
-            args = random.choice(action[1])
-            action[0](*args)
+            self.buy_upgrade(self.rng.choice(buy_upgr))
             
     
     
-class Producer:
-    def __init__(self, name, cpt, base_price, price_scaling):
-        self.name = name
-        self.cpt = cpt # cookies per turn
-        self.base_price = base_price
-        self.price_scaling = price_scaling
-        
-        self.n_owned = 0
-        self.current_price = base_price
-        self.multiplier_funcs = []
-        self.add_pre_funcs = []
-        self.add_post_funcs = []
-
-    
-    def get_production(self):
-        return (self.cpt + self.get_add_pre()) * self.n_owned * self.get_multi() + self.get_add_post()
+class GamePool:
+    """
+    Hands out reset games so episodic workloads don't rebuild one per episode.
     
-    def get_multi(self):
-        return prod(self.get_multis())
+    pool = GamePool(verbose=False)
+    game = pool.acquire(cookies=100)
+    ...
+    pool.release(game)
     
-    def get_multis(self):
-        return [f() for f in self.multiplier_funcs]
+    """
+    def __init__(self, game_cls=None, max_size=None, **game_kwargs):
+        self.game_cls = game_cls or CookieClickerGame
+        self.max_size = max_size
+        self.game_kwargs = game_kwargs
+        self.free = []
+        
+    def acquire(self, cookies=0, seed=None):
+        if self.free:
+            return self.free.pop().reset(cookies=cookies, seed=seed)
+            
+        game = self.game_cls(seed=seed, **self.game_kwargs)
+        game.cookies = cookies
+        return game
         
-    def get_add_pre(self):
-        return sum(self.get_add_pres())
+    def release(self, game):
+        if self.max_size is None or len(self.free) < self.max_size:
+            self.free.append(game)
+            
+    def __len__(self):
+        return len(self.free)
     
-    def get_add_pres(self):
-        return [f() for f in self.add_pre_funcs]
-        
-    def get_add_post(self):
-        return sum(self.get_add_posts())
     
-    def get_add_posts(self):
-        return [f() for f in self.add_post_funcs]
-        
-    def add_multi_func(self, func):
-        self.multiplier_funcs.append(func)
-        
-    def add_add_pre_func(self, func):
-        self.add_pre_funcs.append(func)
+class Producer:
+    """Per-game state of one building type; the definition itself is a shared ProducerSpec."""
+    __slots__ = ("spec", "n_owned", "current_price", "production",
+                 "multiplier", "add_pre", "add_per_other", "grandma_bonuses")
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.reset()
+        
+    def reset(self, n_owned=0):
+        self.n_owned = n_owned
+        self.current_price = self.spec.get_price(n_owned) if n_owned else self.spec.base_price
+        self.production = 0 # last value computed by the game
+        
+        # Compiled upgrade effects
+        self.multiplier = 1
+        self.add_pre = 0
+        self.add_per_other = 0 # per non-cursor building
+        self.grandma_bonuses = () # (upgrade idx, add_multi, per_n): +add_multi per per_n grandmas
+        
+    def copy(self):
+        other = Producer.__new__(Producer)
+        other.spec = self.spec
+        other.n_owned = self.n_owned
+        other.current_price = self.current_price
+        other.production = self.production
+        other.multiplier = self.multiplier
+        other.add_pre = self.add_pre
+        other.add_per_other = self.add_per_other
+        other.grandma_bonuses = self.grandma_bonuses
+        
+        return other
+        
+    @property
+    def name(self):
+        return self.spec.name
+        
+    @property
+    def cpt(self):
+        return self.spec.cpt
+        
+    @property
+    def base_price(self):
+        return self.spec.base_price
+        
+    @property
+    def price_scaling(self):
+        return self.spec.price_scaling
+
+    def get_production(self, n_grandmas=0, n_others=0, n_owned=None):
+        if n_owned is None:
+            n_owned = self.n_owned
+            
+        return (self.spec.cpt + self.get_add_pre(n_others)) * n_owned * self.get_multi(n_grandmas)
     
-    def add_add_post_func(self, func):
-        self.add_post_funcs.append(func)
-       
+    def get_multi(self, n_grandmas=0):
+        multi = self.multiplier
+        for _, add_multi, per_n in self.grandma_bonuses:
+            multi *= 1 + add_multi * n_grandmas / per_n
+            
+        return multi
+        
+    def get_add_pre(self, n_others=0):
+        return self.add_pre + self.add_per_other * n_others
     
     def get_price(self, n):
-        return int(self.base_price * self.price_scaling ** n)
+        return self.spec.get_price(n)
     
-    def buy(self):
-        self.n_owned += 1
+    def buy(self, count=1):
+        self.n_owned += count
         self.current_price = self.get_price(self.n_owned)
         
-    def sell(self):
-        self.n_owned -= 1
+    def sell(self, count=1):
+        self.n_owned -= count
         self.current_price = self.get_price(self.n_owned)
  
     def __str__(self):
@@ -774,11 +1643,8 @@ class Producer:
             f"{self.name:<25s}",
             f"{int(self.n_owned):<10d}",
             f"{format_large_num(self.current_price):<15s}",
-            f"{format_large_num(self.get_production()):<20s}",
-            "{:<10s}".format(" ".join(
-                format_large_num(m) for m in self.get_multis()
-            )),
+            f"{format_large_num(self.production):<20s}",
+            f"{format_large_num(self.multiplier):<10s}",
         ]
         
         return "".join(parts)
-    
\ No newline at end of file
@@ -10,6 +10,6 @@ for i in range(int(100e3)):
     print("---")
     
     
-    game.random_action(weights=[0, 10, 1, 0, 1])
+    game.random_action(weights=[10, 1, 0, 1])
     game.advance()
     
\ No newline at end of file
@@ -0,0 +1,278 @@
+import math
+import time
+from collections import OrderedDict
+
+from game import CookieClickerGame
+from strategy import GreedyPaybackStrategy
+
+
+class Node:
+    """
+    Search statistics of one game state, shared by every purchase order that reaches it.
+    Visits and values are kept per edge (action taken from here), children are looked up in the
+    transposition table by the state they lead to. Different orders reach the state at different
+    turns with different cookies, so the candidate actions are cached for the last (turn, cookies)
+    only.
+
+    """
+    __slots__ = ("visits", "edges", "context", "candidates")
+
+    def __init__(self):
+        self.visits = 0
+        self.edges = {} # action -> [visits, total value]
+        self.context = None # (turn, cookies) the candidates are for
+        self.candidates = [] # actions worth trying, most promising first
+
+
+class MCTSPlanner:
+    """
+    Monte Carlo tree search over purchases, maximising total_cookies at a fixed end turn.
+
+    Actions are the buy entries of the flat action table (game.catalog.actions); each one waits
+    with advance_until (clicking clicks_per_turn times a turn) until the purchase is affordable,
+    then makes it. Leaves are valued by playing on with GreedyPaybackStrategy to the end turn.
+    Children are expanded in payback order (see CookieClickerGame.marginal_gains) and at most
+    max_children of them are considered per visit, among the purchases that idling to the end
+    turn from that visit could pay for.
+
+    Nodes are keyed by (producer counts, upgrade mask), so buying A then B and B then A share
+    statistics. The table keeps at most max_nodes nodes, evicting the least recently used (never
+    the root), and survives between decisions so the subtree below the move actually played is
+    reused.
+
+    The tree path and the greedy rollout are both deterministic, so every iteration's value is
+    that of a purchase line that can actually be played. search() plays the first purchase of
+    the best line found, and keeps that line as the one to beat at the next decision. Since it
+    starts from the greedy line itself, a game played to the end does at least as well as
+    GreedyPaybackStrategy.
+    Each iteration plays on a clone of the root game, which keeps its cached production.
+
+    planner = MCTSPlanner(iterations=20)
+    planner.play(game, 2000)
+
+    """
+    def __init__(self, iterations=None, time_limit=None, max_nodes=100000, max_children=8,
+                 exploration=1.4, clicks_per_turn=1):
+        if iterations is None and time_limit is None:
+            iterations = 1000
+
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.max_nodes = max_nodes
+        self.max_children = max_children
+        self.exploration = exploration
+        self.clicks_per_turn = clicks_per_turn
+
+        self.table = OrderedDict() # (producer counts, upgrade mask) -> Node
+        self.end_turn = None
+        self.catalog = None
+        self.root_key = None
+        self.plan = None # (state key, turn, cookies, value, actions): best line from that state
+        self.policy = None # rollout GreedyPaybackStrategy, reset onto each rollout's game
+
+    def reset(self):
+        self.table.clear()
+        self.end_turn = None
+        self.plan = None
+
+    @staticmethod
+    def key(game):
+        return tuple(p.n_owned for p in game.producers), game.upgrade_mask
+
+    def _set_catalog(self, catalog):
+        if catalog is not self.catalog:
+            self.catalog = catalog
+            self.action_index = {action: i for i, action in enumerate(catalog.actions)}
+            self.reset()
+
+    def get_node(self, game):
+        """Node of game's state, created (evicting the least recently used one if full) if new."""
+        key = self.key(game)
+        node = self.table.get(key)
+        if node is not None:
+            self.table.move_to_end(key)
+            return node
+
+        node = self.table[key] = Node()
+        if len(self.table) > self.max_nodes:
+            if next(iter(self.table)) == self.root_key:
+                self.table.move_to_end(self.root_key)
+            self.table.popitem(last=False)
+
+        return node
+
+    def candidates(self, game, node):
+        """Actions worth trying from node's state as reached in game, most promising first."""
+        context = (game.turn, game.cookies)
+        if node.context != context:
+            # The next purchase is waited for at this state's income, so anything that costs
+            # more than idling to the end turn would bring can't be reached from here
+            rate = game.get_cpt() + self.clicks_per_turn * game.get_cpc()
+            budget = game.cookies + rate * (self.end_turn - game.turn)
+            gains = sorted(game.marginal_gains(self.clicks_per_turn, budget), key=lambda g: g.payback)
+            node.candidates = [self.action_index[(g.kind, g.idx)] for g in gains[:self.max_children] if g.payback < math.inf]
+            node.context = context
+
+        return node.candidates
+
+    def apply(self, game, action):
+        """Wait for and make purchase action. False (game unchanged) if it can't happen before the end turn."""
+        kind, target = self.catalog.actions[action]
+        target = game.producers[target] if kind == "buy_producer" else game.upgrades[target]
+        if kind == "buy_upgrade" and game.owns_upgrade(target.idx):
+            return False
+
+        n_turns = game.turns_until_affordable(target, self.clicks_per_turn)
+        if n_turns is None or game.turn + n_turns > self.end_turn:
+            return False
+
+        game.advance(n_turns, self.clicks_per_turn)
+        return game.do_action(action)
+
+    def rollout(self, game):
+        """
+        Play on greedily (GreedyPaybackStrategy) to the end turn. Returns (total_cookies at the
+        end turn, flat action indices of the purchases made).
+
+        """
+        if self.policy is None:
+            self.policy = GreedyPaybackStrategy(game, self.clicks_per_turn)
+        else:
+            self.policy.reset(game)
+
+        actions = []
+        while game.turn < self.end_turn:
+            purchase = self.policy.step(self.end_turn - game.turn)
+            if purchase is None:
+                game.advance(self.end_turn - game.turn, self.clicks_per_turn)
+            else:
+                actions.append(self.action_index[purchase])
+
+        return game.total_cookies, actions
+
+    def select(self, node, candidates):
+        log_visits = math.log(node.visits)
+        low, high = self.value_range
+        scale = high - low
+
+        best, best_score = None, -math.inf
+        for action in candidates:
+            visits, value = node.edges[action]
+            mean = (value / visits - low) / scale if scale > 0 else 0.5
+            score = mean + self.exploration * math.sqrt(log_visits / visits)
+            if score > best_score:
+                best, best_score = action, score
+
+        return best
+
+    def iterate(self, game, root):
+        """One selection, expansion, rollout and backup from root. Returns (value, actions) of the line played."""
+        # Purchases only ever add, so a path can't revisit a state
+        nodes = [root]
+        path = []
+        node = root
+
+        while True:
+            candidates = self.candidates(game, node)
+            if not candidates:
+                break
+
+            untried = [action for action in candidates if action not in node.edges]
+            action = untried[0] if untried else self.select(node, candidates)
+
+            if not self.apply(game, action):
+                # Not possible in time from this visit; other visits keep the edge
+                node.candidates = [a for a in candidates if a != action]
+                break
+
+            if untried:
+                node.edges[action] = [0, 0]
+                path.append((node, action))
+                nodes.append(self.get_node(game))
+                break
+
+            path.append((node, action))
+            node = self.get_node(game)
+            nodes.append(node)
+
+        value, actions = self.rollout(game)
+        low, high = self.value_range
+        self.value_range = (min(low, value), max(high, value))
+
+        for node in nodes:
+            node.visits += 1
+        for node, action in path:
+            edge = node.edges[action]
+            edge[0] += 1
+            edge[1] += value
+
+        return value, [action for _, action in path] + actions
+
+    def search(self, game, end_turn):
+        """
+        Plan from game's state towards end_turn. Returns the flat action index of the first
+        purchase of the best line found, or None if the best line buys nothing.
+        The game itself is not changed.
+
+        """
+        self._set_catalog(game.catalog)
+        if end_turn != self.end_turn:
+            self.reset()
+            self.end_turn = end_turn
+            self.value_range = (math.inf, -math.inf)
+
+        start = game.clone()
+        start.verbose = False
+        self.root_key = self.key(start)
+        root = self.get_node(start)
+
+        # The line kept from the last decision, if this is the state it leads to, else greedy
+        plan = self.plan
+        if plan is None or plan[:3] != (self.root_key, start.turn, start.cookies):
+            plan = (None, None, None) + self.rollout(start.clone())
+        _, _, _, best_value, best_actions = plan
+
+        deadline = None if self.time_limit is None else time.perf_counter() + self.time_limit
+        i = 0
+        while self.iterations is None or i < self.iterations:
+            if deadline is not None and i % 16 == 0 and time.perf_counter() > deadline:
+                break
+
+            value, actions = self.iterate(start.clone(), root)
+            if value > best_value:
+                best_value, best_actions = value, actions
+            i += 1
+
+            if not root.candidates:
+                break
+
+        if not best_actions:
+            self.plan = None
+            return None
+
+        action = best_actions[0]
+        after = start.clone()
+        self.apply(after, action)
+        self.plan = (self.key(after), after.turn, after.cookies, best_value, best_actions[1:])
+        return action
+
+    def step(self, game, end_turn):
+        """Search, then make the chosen purchase on game. Returns the action, or None."""
+        action = self.search(game, end_turn)
+        if action is None or not self.apply(game, action):
+            return None
+
+        return action
+
+    def play(self, game, n_turns):
+        """Play until game.turn reaches n_turns. Returns the game."""
+        while game.turn < n_turns:
+            if self.step(game, n_turns) is None:
+                game.advance(n_turns - game.turn, self.clicks_per_turn)
+
+        return game
+
+
+if __name__ == "__main__":
+    game = MCTSPlanner(iterations=20).play(CookieClickerGame(verbose=False), 2000)
+    print(game)
@@ -1,3 +1,9 @@
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+import numpy as np
 import torch.nn as nn
 import torch
 from torch.nn.functional import relu, smooth_l1_loss
@@ -29,6 +35,202 @@ def train(model, actual, outputs):
     loss = model.loss(actual, outputs)
     loss.backward()
     model.optimizer.step()
+    
+def train_on_rewards(model, states, actions, rewards, alpha=0.01):
+    """
+    Batched reinforcement update: nudge each taken action's prediction by +alpha on a positive
+    reward, -alpha on a negative one. Transitions with zero reward are left out.
+    
+    """
+    keep = rewards != 0
+    if not keep.any():
+        return
+        
+    states, actions, rewards = states[keep], actions[keep], rewards[keep]
+    
+    preds = model(states)
+    desired = preds.detach().clone()
+    desired[torch.arange(len(actions)), actions] += alpha * torch.sign(rewards)
+    train(model, desired, preds)
+    
+
+class ReplayBuffer:
+    """
+    Fixed-capacity ring buffer of (state, action, reward, next_state) transitions in preallocated
+    tensors. Once full, the oldest transitions are overwritten.
+    
+    """
+    def __init__(self, capacity, state_size):
+        self.capacity = capacity
+        self.states = torch.zeros((capacity, state_size))
+        self.actions = torch.zeros(capacity, dtype=torch.long)
+        self.rewards = torch.zeros(capacity)
+        self.next_states = torch.zeros((capacity, state_size))
+        
+        self.size = 0
+        self.pos = 0
+        
+    def __len__(self):
+        return self.size
+        
+    def add(self, state, action, reward, next_state):
+        """Store one transition, or a batch if state is 2D."""
+        state = torch.as_tensor(state, dtype=torch.float)
+        if state.dim() == 1:
+            i = self.pos
+            self.states[i] = state
+            self.actions[i] = action
+            self.rewards[i] = reward
+            self.next_states[i] = torch.as_tensor(next_state, dtype=torch.float)
+            n = 1
+        else:
+            n = len(state)
+            i = (self.pos + torch.arange(n)) % self.capacity
+            self.states[i] = state
+            self.actions[i] = torch.as_tensor(action, dtype=torch.long)
+            self.rewards[i] = torch.as_tensor(reward, dtype=torch.float)
+            self.next_states[i] = torch.as_tensor(next_state, dtype=torch.float)
+            
+        self.pos = (self.pos + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+        
+    def sample(self, batch_size, generator=None):
+        i = torch.randint(self.size, (batch_size,), generator=generator)
+        return self.states[i], self.actions[i], self.rewards[i], self.next_states[i]
+        
+
+class MinibatchLearner:
+    """
+    Collects transitions into a ReplayBuffer and every train_every steps trains model on a
+    sampled minibatch with train_on_rewards, instead of one optimizer step per transition.
+    
+    """
+    def __init__(self, model, buffer, batch_size=64, train_every=4, alpha=0.01):
+        self.model = model
+        self.buffer = buffer
+        self.batch_size = batch_size
+        self.train_every = train_every
+        self.alpha = alpha
+        
+        self.steps = 0
+        
+    def observe(self, state, action, reward, next_state):
+        self.buffer.add(state, action, reward, next_state)
+        self.steps += 1
+        
+        if self.steps % self.train_every == 0 and len(self.buffer) >= self.batch_size:
+            self.update()
+            
+    def update(self):
+        states, actions, rewards, _ = self.buffer.sample(self.batch_size)
+        train_on_rewards(self.model, states, actions, rewards, self.alpha)
+
+
+def export_weights(model, path):
+    """Save a LinearPredictor's weights as a .npz file for numpy_predictor.NumpyPredictor."""
+    np.savez(path, **{name: tensor.detach().cpu().numpy() for name, tensor in model.state_dict().items()})
+        
+        
+class BatchedInference:
+    """
+    Inference service shared by many games. States submitted from any thread are gathered into
+    batches of up to max_batch_size, waiting at most max_delay seconds for a batch to fill,
+    and run through model in one forward pass.
+    
+    inference = BatchedInference(model)
+    future = inference.submit(state) # or inference.predict(state) to wait for the result
+    ...
+    inference.close()
+    
+    """
+    def __init__(self, model, max_batch_size=256, max_delay=0.001):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        
+        self.requests = queue.Queue()
+        self.closed = False
+        self.lock = threading.Lock() # orders submits against close()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        
+    def submit(self, state):
+        """Queue one state, returns a Future of its prediction row. RuntimeError after close()."""
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("BatchedInference is closed")
+            self.requests.put((state, future))
+            
+        return future
+        
+    def predict(self, state):
+        return self.submit(state).result()
+        
+    def close(self):
+        """Finish the requests already submitted and stop the worker thread."""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.requests.put(None)
+            
+        self.thread.join()
+        
+        # Anything the worker didn't get to (it stopped early) fails rather than hanging
+        while True:
+            try:
+                item = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(RuntimeError("BatchedInference is closed"))
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, *exc):
+        self.close()
+        
+    def _collect(self):
+        # Block for the first request, then fill the batch until it is full or the deadline passes
+        first = self.requests.get()
+        if first is None:
+            return None
+            
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+                
+            if item is None:
+                self.requests.put(None) # finish this batch, stop on the next collect
+                break
+            batch.append(item)
+            
+        return batch
+        
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+                
+            try:
+                states = torch.stack([torch.as_tensor(state, dtype=torch.float) for state, _ in batch])
+                with torch.inference_mode():
+                    preds = self.model(states)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+                
+            for (_, future), pred in zip(batch, preds):
+                future.set_result(pred)
         
         
 if __name__ == "__main__":
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+class NumpyPredictor:
+    """
+    Forward pass of a trained network.LinearPredictor in plain NumPy, for processes that only
+    need predictions and shouldn't import torch. Load weights written by network.export_weights().
+
+    predictor = NumpyPredictor.load("predictor.npz")
+    preds = predictor(state)       # one state -> (n_actions,)
+    preds = predictor(states)      # (batch, state_size) -> (batch, n_actions)
+
+    """
+    layers = ("lin1", "lin2", "lin3", "head")
+
+    def __init__(self, weights):
+        # Stored as (in, out) so a row vector or a batch multiplies straight through
+        self.weights = [np.ascontiguousarray(weights[f"{name}.weight"].T, dtype=np.float32) for name in self.layers]
+        self.biases = [np.asarray(weights[f"{name}.bias"], dtype=np.float32) for name in self.layers]
+
+        self.input_size = self.weights[0].shape[0]
+        self.output_size = self.weights[-1].shape[1]
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as weights:
+            return cls(weights)
+
+    def __call__(self, x):
+        x = np.asarray(x, dtype=np.float32)
+
+        *hidden, head = zip(self.weights, self.biases)
+        for w, b in hidden:
+            x = x @ w
+            x += b
+            np.maximum(x, 0, out=x)
+
+        w, b = head
+        x = x @ w
+        x += b
+
+        # sigmoid, written with tanh so large negative inputs don't overflow exp
+        x *= 0.5
+        np.tanh(x, out=x)
+        x += 1
+        x *= 0.5
+        return x
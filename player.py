@@ -1,86 +1,97 @@
-from game import CookieClickerGame
+from game import CookieClickerGame, GamePool
 import random
-from network import LinearPredictor, train
-import torch
+
+import numpy as np
+
+# torch and network are imported inside the learning code, so playing games doesn't load them
 
 def argmax(x):
     return max(range(len(x)), key=lambda i: x[i])
 
 class State:
-    def __init__(self, game):
+    """
+    Observation of a game: producer counts followed by upgrade ownership bits.
+
+    The observation lives in one float32 buffer (out, or allocated here) that is kept up to date
+    as actions go through perform_action, so get_state() returns the same array every call.
+    Call refresh() after changing the game any other way.
+
+    """
+    def __init__(self, game, out=None):
         self.game = game
+        self.n_producers = len(game.producers)
+
+        size = self.n_producers + len(game.upgrades)
+        self.buffer = np.zeros(size, dtype=np.float32) if out is None else out
+        self.tensor = None # torch view of buffer, see get_state_tensor
+        self.refresh()
+        
+        # Flat action index -> (kind, target) is fixed per catalog; decoded holds the
+        # perform_action form of each entry, bound to this game
+        self.actions = game.catalog.actions
+        self.decoded = tuple(
+            (getattr(game, kind),) if target is None else (getattr(game, kind), (target,))
+            for kind, target in self.actions
+        )
+        self.mask = np.zeros(len(self.actions), dtype=bool)
+
+    def refresh(self):
+        """Re-encode the whole observation from the game."""
+        buffer = self.buffer
+        for i, p in enumerate(self.game.producers):
+            buffer[i] = p.n_owned
+        for i in range(len(self.game.upgrades)):
+            buffer[self.n_producers + i] = self.game.owns_upgrade(i)
+
+        return buffer
         
     def get_state(self):
-        upgrade_state = [int(u.owned) for u in self.game.upgrades]
-        producer_state = [int(p.n_owned) for p in self.game.producers]
-    
-        return producer_state + upgrade_state
+        return self.buffer
+
+    def get_state_tensor(self):
+        """The observation as a torch tensor sharing memory with the buffer (no copy)."""
+        if self.tensor is None:
+            import torch
+            self.tensor = torch.from_numpy(self.buffer)
+
+        return self.tensor
         
     def get_action_space(self):
-        all_actions = self.game.get_all_actions()
-        
-        total_actions = 0
-        for action in all_actions:
-            if len(action) == 1:
-                total_actions += 1
-            else:
-                total_actions += len(action[1])
-                
-        return total_actions
+        return len(self.actions)
         
     def get_action_availability(self):
-        all_actions = self.game.get_all_actions()
-        avail_actions = self.game.get_available_actions()
-        action_availability = []
-        
-        for i, action in enumerate(all_actions):
-            if len(action) == 1:
-                action_availability.append(True)
-            else:
-                for args in action[1]:
-                    if args in avail_actions[i][1]:
-                        action_availability.append(True)
-                    else:
-                        action_availability.append(False)
-                        
-        return action_availability
+        """Legal actions as a bool array over the flat action table, reused between calls."""
+        return self.game.fill_action_mask(self.mask)
         
     def prediction_to_action(self, pred):
-        all_actions = self.game.get_all_actions()
-        
-        for i, action in enumerate(all_actions):
-            if len(action) == 1:
-                if pred == 0:
-                    return action
-                else:
-                    pred -= 1
-                    
-            else:
-                if pred < len(action[1]):
-                    return action[0], action[1][pred]
-                else:
-                    pred -= len(action[1])
+        if 0 <= pred < len(self.decoded):
+            return self.decoded[pred]
             
         return None
         
     def perform_action(self, action, advance=True):
-        old_state = self.get_state()
         old_value = self.game.cpt
     
-    
         if len(action) == 1:
             action[0]()
         else:
             action[0](*action[1])
+            self._update(action[0].__name__, action[1][0])
             
         if advance:
             self.game.advance()
     
-        new_state = self.get_state()
         new_value = self.game.cpt
         
         return new_value - old_value # reward
         
+    def _update(self, kind, idx):
+        # Only the entry the action targeted can have changed
+        if kind == "buy_upgrade":
+            self.buffer[self.n_producers + idx] = self.game.owns_upgrade(idx)
+        else:
+            self.buffer[idx] = self.game.producers[idx].n_owned
+        
         
 class Predictor:
     def __init__(self):
@@ -100,22 +111,33 @@ class Predictor:
         print(preds)
         return argmax(preds)
         
-def reinforcement_learn(predictor, turns=1000):
-    game = CookieClickerGame(verbose=False)
-    game.cookies = 100
+game_pool = GamePool(verbose=False)
+        
+def reinforcement_learn(predictor, turns=1000, learner=None):
+    import torch
+    from network import ReplayBuffer, MinibatchLearner
+    
+    game = game_pool.acquire(cookies=100)
     state = State(game)
     # predictor = Predictor()
     # predictor = LinearPredictor(len(state.get_state()), state.get_action_space())
     
-    for i in range(1000):
+    if learner is None:
+        learner = MinibatchLearner(predictor, ReplayBuffer(10000, len(state.get_state())))
+    
+    state_values = np.empty_like(state.get_state()) # observation before the action
+    inputs_tensor = state.get_state_tensor()
+    
+    for i in range(turns):
         # print(game.str_basic())
         # print(game)
         
         # pred = predictor.predict(state)
-        inputs_tensor = torch.tensor(state.get_state(), dtype=torch.float)
-        pred_tensor = predictor(inputs_tensor)
+        np.copyto(state_values, state.get_state())
+        with torch.no_grad():
+            pred_tensor = predictor(inputs_tensor)
         
-        avail_preds = [p * a for p, a in zip(pred_tensor.detach().numpy(), state.get_action_availability())]
+        avail_preds = pred_tensor.numpy() * state.get_action_availability()
         # pred_idx = argmax(avail_preds)
         pred_idx = random.choices(range(len(avail_preds)), avail_preds, k=1)[0]
         
@@ -125,22 +147,20 @@ def reinforcement_learn(predictor, turns=1000):
         # print(avail_preds, "->", pred_idx)
         # print("reward:", reward)
         
-        desired_tensor = pred_tensor.clone()
-        
-        alpha = 0.01
-        if reward > 0:
-            desired_tensor[pred_idx] += alpha
-            train(predictor, desired_tensor, pred_tensor)
-        elif reward < 0:
-            desired_tensor[pred_idx] -= alpha
-            train(predictor, desired_tensor, pred_tensor)
+        learner.observe(state_values, pred_idx, reward, state.get_state())
             
     print(game.total_cookies, game.cpt)
+    game_pool.release(game)
+    
+    return learner
     
         
 if __name__ == "__main__":
+    from network import LinearPredictor
+    
     _state = State(CookieClickerGame())
     predictor = LinearPredictor(len(_state.get_state()), _state.get_action_space())
     
+    learner = None
     for i in range(10):
-        reinforcement_learn(predictor, 1000)
\ No newline at end of file
+        learner = reinforcement_learn(predictor, 1000, learner)
\ No newline at end of file
@@ -0,0 +1,219 @@
+import math
+import mmap
+import struct
+
+from game import CookieClickerGame, GameSnapshot
+
+MAGIC = b"CCSA"
+VERSION = 2 # 2 added the upgrade effect scalars; version 1 files are still read
+
+# magic, version, n_producers, n_upgrades, record_size, names_size
+_HEADER = struct.Struct("<4sHHHII")
+
+
+class RecordFormat:
+    """
+    Fixed-width binary layout of one game state for a given catalog:
+    producer counts (uint32 each), upgrade ownership bitset, turn, cpt, cookies, total_cookies,
+    then (from version 2) the upgrade effect scalars, see CookieClickerGame.get_effects().
+
+    The producer and upgrade names are written in the header, so states saved under an older
+    producer_spec / upgrade_spec are mapped onto the current one by name. Those, and version 1
+    records, have their effects rebuilt from the upgrades on restore.
+
+    The event queue isn't stored: restore rebuilds it from the holdings, so a recurring
+    UpdateUpgrade next updates a period after the saved turn, whatever its phase was.
+
+    """
+    def __init__(self, producer_names, upgrade_names, version=VERSION):
+        self.producer_names = tuple(producer_names)
+        self.upgrade_names = tuple(upgrade_names)
+        self.version = version
+        self.mask_size = (len(self.upgrade_names) + 7) // 8
+        self.n_effects = 4 + 3 * len(self.producer_names) if version >= 2 else 0
+        self.struct = struct.Struct(f"<{len(self.producer_names)}I{self.mask_size}sQddd{self.n_effects}d")
+
+    @classmethod
+    def for_catalog(cls, catalog):
+        return cls([p.name for p in catalog.producers], [u.name for u in catalog.upgrades])
+
+    @property
+    def record_size(self):
+        return self.struct.size
+
+    def pack(self, snapshot):
+        effects = snapshot.effects
+        if effects is None:
+            effects = (math.nan,) * self.n_effects # rebuilt from the upgrades on restore
+
+        return self.struct.pack(
+            *snapshot.producer_counts,
+            snapshot.upgrade_mask.to_bytes(self.mask_size, "little"),
+            snapshot.turn, snapshot.cpt, snapshot.cookies, snapshot.total_cookies,
+            *effects[:self.n_effects],
+        )
+
+    def unpack_from(self, buffer, offset=0):
+        values = self.struct.unpack_from(buffer, offset)
+        n_producers = len(self.producer_names)
+        counts = values[:n_producers]
+        mask, turn, cpt, cookies, total_cookies = values[n_producers:n_producers + 5]
+        effects = values[n_producers + 5:]
+        if not effects or math.isnan(effects[0]):
+            effects = None
+        return GameSnapshot(
+            tuple(counts), int.from_bytes(mask, "little"), turn, cpt,
+            turn, cookies, total_cookies, 0, 0, effects=effects,
+        )
+
+    def header(self):
+        names = "\n".join(self.producer_names + self.upgrade_names).encode()
+        header = _HEADER.pack(MAGIC, self.version, len(self.producer_names), len(self.upgrade_names), self.record_size, len(names))
+        return header + names + bytes(-(len(header) + len(names)) % 8) # records start 8-aligned
+
+    @classmethod
+    def read_header(cls, buffer):
+        """Returns (format, offset of the first record)."""
+        magic, version, n_producers, n_upgrades, record_size, names_size = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a cookie clicker state file")
+        if not 1 <= version <= VERSION:
+            raise ValueError(f"Unsupported state file version: {version}")
+
+        names = bytes(buffer[_HEADER.size:_HEADER.size + names_size]).decode().split("\n")
+        fmt = cls(names[:n_producers], names[n_producers:], version)
+        if fmt.record_size != record_size:
+            raise ValueError(f"Corrupt state file header: record size {record_size}, expected {fmt.record_size}")
+
+        offset = _HEADER.size + names_size
+        return fmt, offset + (-offset % 8)
+
+    def converter(self, catalog):
+        """
+        Function mapping a snapshot in this format onto catalog.
+        Producers and upgrades missing from catalog are dropped.
+
+        """
+        target = RecordFormat.for_catalog(catalog)
+        if (target.producer_names, target.upgrade_names) == (self.producer_names, self.upgrade_names):
+            return lambda snapshot: snapshot
+
+        producer_map = [target.producer_names.index(n) if n in target.producer_names else None for n in self.producer_names]
+        upgrade_map = [target.upgrade_names.index(n) if n in target.upgrade_names else None for n in self.upgrade_names]
+
+        def convert(snapshot):
+            counts = [0] * len(target.producer_names)
+            for n, i in zip(snapshot.producer_counts, producer_map):
+                if i is not None:
+                    counts[i] = n
+
+            mask = 0
+            for bit, i in enumerate(upgrade_map):
+                if i is not None and (snapshot.upgrade_mask >> bit) & 1:
+                    mask |= 1 << i
+
+            # The effects were compiled for the old catalog, so they're rebuilt from the upgrades
+            return snapshot._replace(producer_counts=tuple(counts), upgrade_mask=mask, effects=None)
+
+        return convert
+
+
+def dumps(game):
+    """Single game state as bytes: header followed by one record."""
+    fmt = RecordFormat.for_catalog(game.catalog)
+    return fmt.header() + fmt.pack(game.snapshot())
+
+def loads(data, game=None):
+    """Restore a state from dumps() into game, or a new non-verbose CookieClickerGame."""
+    if game is None:
+        game = CookieClickerGame(verbose=False)
+
+    fmt, offset = RecordFormat.read_header(data)
+    return game.restore(fmt.converter(game.catalog)(fmt.unpack_from(data, offset)))
+
+
+class StateArchive:
+    """
+    One file of many fixed-width state records, read through a memory map so any record can be
+    fetched without loading the rest.
+
+    with StateArchive.create("states.ccsa") as archive:
+        archive.append(game)
+
+    with StateArchive.open("states.ccsa") as archive:
+        archive.restore(len(archive) - 1, game)
+
+    """
+    def __init__(self, file, fmt, offset, writable):
+        self.file = file
+        self.format = fmt
+        self.offset = offset
+        self.writable = writable
+        self.map = None
+        self.converters = {} # catalog -> converter, see RecordFormat.converter
+
+        if not writable:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @classmethod
+    def create(cls, path, catalog=None):
+        fmt = RecordFormat.for_catalog(catalog or CookieClickerGame.get_catalog())
+        file = open(path, "wb")
+        header = fmt.header()
+        file.write(header)
+        return cls(file, fmt, len(header), writable=True)
+
+    @classmethod
+    def open(cls, path, append=False):
+        file = open(path, "r+b" if append else "rb")
+        header = file.read(_HEADER.size)
+        header += file.read(_HEADER.unpack(header)[-1])
+        fmt, offset = RecordFormat.read_header(header)
+        file.seek(0, 2)
+        return cls(file, fmt, offset, writable=append)
+
+    def append(self, game_or_snapshot):
+        if not self.writable:
+            raise ValueError("Archive opened read-only")
+
+        snapshot = game_or_snapshot.snapshot() if isinstance(game_or_snapshot, CookieClickerGame) else game_or_snapshot
+        self.file.write(self.format.pack(snapshot))
+
+    def __len__(self):
+        size = len(self.map) if self.map is not None else self.file.tell()
+        return (size - self.offset) // self.format.record_size
+
+    def __getitem__(self, i):
+        """Snapshot i, in the archive's own catalog layout."""
+        if self.map is None:
+            raise ValueError("Archive opened for writing; reopen it to read")
+
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError(i)
+
+        return self.format.unpack_from(self.map, self.offset + i * self.format.record_size)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def restore(self, i, game):
+        convert = self.converters.get(game.catalog)
+        if convert is None:
+            convert = self.converters[game.catalog] = self.format.converter(game.catalog)
+
+        return game.restore(convert(self[i]))
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,473 @@
+import bisect
+import math
+import multiprocessing as mp
+import os
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from game import CookieClickerGame
+from strategy import GreedyPaybackStrategy
+
+
+def richest_game(game, budget):
+    """
+    Copy of game that also owns everything it could buy with budget cookies, each purchase paid
+    for on its own. Every effect only grows with the holdings, so its rates and marginal gains
+    are at least those of any game reached from game by spending at most budget.
+
+    """
+    game = game.clone()
+    game.verbose = False
+    game.cookies = math.inf
+
+    for i, p in enumerate(game.producers):
+        count = p.spec.get_max_affordable(p.n_owned, budget)
+        if count > 0:
+            game.buy_producer(i, count)
+
+    for cost, idx in list(game.upgrades_by_cost):
+        if cost > budget:
+            break
+        game.buy_upgrade(idx)
+
+    return game
+
+
+class GrowthBound:
+    """
+    Lower bounds on the turns any state of one search needs to raise production, built from the
+    search's first state game for schedules taking at most horizon turns.
+
+    Marginal gains only grow with the holdings, and prices only rise, so no purchase in the
+    search adds more than its gain in richest_game (of the most the search can spend, see the
+    targets' spend_limit) at its price in game. Every state's extra production from spending
+    S cookies is then at most the best fractional knapsack of those purchases that fits in S.
+    That goes for income (production plus clicks) too, which bounds how fast S can grow.
+
+    """
+    max_rounds = 8 # to settle the budget, see __init__
+
+    def __init__(self, game, target, clicks_per_turn, horizon):
+        self.clicks_per_turn = clicks_per_turn
+        self.budget = 0
+        self.production = self.income = None
+        if game.events:
+            return # timed effects can raise production beyond the holdings
+
+        # Spending and rates bound each other: grow the budget until it covers the income its
+        # own richest game's rates allow
+        budget = target.spend_limit(game, clicks_per_turn, horizon, game.get_cpt(), game.get_cpc())
+        for _ in range(self.max_rounds):
+            richest = richest_game(game, budget)
+            more = target.spend_limit(game, clicks_per_turn, horizon, richest.get_cpt(), richest.get_cpc())
+            if more <= budget:
+                break
+            budget = more
+        else:
+            return
+
+        # (price, d_cpt, d_cpc) of everything the search could buy
+        purchases = []
+        for i, p in enumerate(game.producers):
+            d_cpt, d_cpc = richest.producer_gain(i)
+            for n in range(p.n_owned, p.n_owned + p.spec.get_max_affordable(p.n_owned, budget)):
+                purchases.append((p.spec.get_price(n), d_cpt, d_cpc))
+
+        # An owned upgrade's gain in richest is what it adds on top of all the rest
+        snapshot = richest.snapshot()
+        probe = richest.clone()
+        for cost, idx in game.upgrades_by_cost:
+            if cost > budget:
+                break
+            probe.restore(snapshot._replace(upgrade_mask=snapshot.upgrade_mask & ~(1 << idx), effects=None))
+            probe.get_cpt()
+            purchases.append((cost,) + tuple(game.upgrades[idx].marginal_gain(probe)))
+
+        self.budget = budget
+        self.production = _knapsack([(cost, d_cpt) for cost, d_cpt, _ in purchases])
+        self.income = _knapsack([(cost, d_cpt + clicks_per_turn * d_cpc) for cost, d_cpt, d_cpc in purchases])
+
+    def turns(self, game, horizon, total=math.inf, cpt=math.inf):
+        """
+        Lower bound on the turns from game until total more cookies are produced or production
+        reaches cpt, whichever comes first. Anything from horizon up means "not sooner".
+
+        """
+        if self.production is None or game.events:
+            return 0
+
+        # Turn by turn at the fastest growth spending could give. The slack only ever makes the
+        # bound smaller, so rounding can't make it unsound
+        total *= 1 - 1e-9
+        cpt *= 1 - 1e-9
+        cpt_now = game.get_cpt()
+        income_now = cpt_now + self.clicks_per_turn * game.get_cpc() if self.clicks_per_turn else cpt_now
+        cookies = game.cookies
+        produced = 0
+        for turn in range(int(min(horizon, 1e9))):
+            rate = cpt_now + _knapsack_value(self.production, cookies)
+            if rate >= cpt:
+                return turn
+            produced += rate
+            if produced >= total:
+                return turn + 1
+            cookies += income_now + _knapsack_value(self.income, cookies)
+
+        return horizon
+
+def _knapsack(items):
+    # Best fractional knapsack of (cost, value) items by budget, as breakpoints: prefix sums of
+    # cost and value over the items by value per cost
+    items = sorted((i for i in items if i[1] > 0), key=lambda i: i[1] / i[0], reverse=True)
+    costs, values = [0], [0]
+    for cost, value in items:
+        costs.append(costs[-1] + cost)
+        values.append(values[-1] + value)
+    return costs, values
+
+def _knapsack_value(knapsack, budget):
+    costs, values = knapsack
+    i = bisect.bisect_right(costs, budget)
+    if i == len(costs):
+        return values[-1]
+    return values[i - 1] + (budget - costs[i - 1]) * (values[i] - values[i - 1]) / (costs[i] - costs[i - 1])
+
+
+class TotalCookiesTarget:
+    """Reach amount total_cookies (cookies produced, clicks don't count)."""
+    def __init__(self, amount):
+        self.amount = amount
+
+    def turns_to_reach(self, game, clicks_per_turn=0):
+        """Turns of waiting until the target is reached with no more purchases, or None."""
+        return game.turns_until_total(self.amount, clicks_per_turn)
+
+    def spend_limit(self, game, clicks_per_turn, horizon, cpt, cpc):
+        """
+        Most cookies a schedule from game can spend before it reaches the target or horizon
+        turns pass, if its rates never exceed cpt / cpc: production past the target doesn't count.
+
+        """
+        missing = max(self.amount - game.total_cookies, 0)
+        return game.cookies + min(missing, horizon * cpt) + horizon * clicks_per_turn * cpc
+
+    def turns_lower_bound(self, game, horizon, growth):
+        """Turns no schedule from game reaches the target in, see GrowthBound."""
+        missing = self.amount - game.total_cookies
+        return growth.turns(game, horizon, total=missing) if missing > 0 else 0
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.amount:g})"
+
+class CPSTarget:
+    """Reach cpt cookies per turn of production."""
+    def __init__(self, cpt):
+        self.cpt = cpt
+
+    def turns_to_reach(self, game, clicks_per_turn=0):
+        return 0 if game.get_cpt() >= self.cpt else None
+
+    def spend_limit(self, game, clicks_per_turn, horizon, cpt, cpc):
+        """Most cookies a schedule from game can spend in horizon turns if its rates never exceed cpt / cpc."""
+        return game.cookies + horizon * (cpt + clicks_per_turn * cpc)
+
+    def turns_lower_bound(self, game, horizon, growth):
+        """Turns no schedule from game reaches the target in, see GrowthBound."""
+        return growth.turns(game, horizon, cpt=self.cpt)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.cpt:g})"
+
+
+Solution = namedtuple("Solution", ["turns", "actions", "optimal", "nodes"])
+Solution.__doc__ = """
+Result of solve().
+turns: turn the target is reached, counted from turn 0 of the game
+actions: flat action indices (see Catalog.actions) of the purchases, in order; each is made as
+         soon as it is affordable, then the target is waited for
+optimal: whether the search finished, rather than stopping at max_nodes
+nodes: states expanded
+"""
+
+
+def play_schedule(game, actions, target, clicks_per_turn=1):
+    """
+    Make the purchases in actions on game, each as soon as it is affordable, then wait for
+    target. Returns the turn the target is reached, or None if the schedule can't be played.
+
+    """
+    for action in actions:
+        kind, idx = game.catalog.actions[action]
+        cost = game.producers[idx].current_price if kind == "buy_producer" else game.upgrades[idx].cost
+        if game.advance_until(cost, clicks_per_turn) is None or not game.do_action(action):
+            return None
+
+    n_turns = target.turns_to_reach(game, clicks_per_turn)
+    if n_turns is None:
+        return None
+
+    game.advance(n_turns, clicks_per_turn)
+    return game.turn
+
+
+def greedy_schedule(game, target, clicks_per_turn=1):
+    """
+    (turns, actions) of the best stopping point of the greedy payback strategy from game:
+    it buys greedily and after each purchase checks how soon waiting would reach target.
+    turns is inf if it never reaches it.
+
+    """
+    game = game.clone()
+    game.verbose = False
+    action_index = {action: i for i, action in enumerate(game.catalog.actions)}
+    strategy = GreedyPaybackStrategy(game, clicks_per_turn)
+
+    best, best_actions = math.inf, []
+    actions = []
+    while True:
+        n_turns = target.turns_to_reach(game, clicks_per_turn)
+        if n_turns is not None and game.turn + n_turns < best:
+            best, best_actions = game.turn + n_turns, list(actions)
+
+        purchase = strategy.step(None if best == math.inf else best - game.turn - 1)
+        if purchase is None:
+            return best, best_actions
+        actions.append(action_index[purchase])
+
+
+class BranchAndBound:
+    """
+    Depth-first search over purchase orders for the fewest turns to reach a target.
+
+    Each branch buys one producer or upgrade as soon as it is affordable. A state is pruned when
+    its lower bound can't beat the best schedule found so far: the turn now plus the larger of
+    the target's turns_lower_bound (see GrowthBound) and the smaller of the wait to reach the
+    target without buying and the wait for the cheapest useful purchase, since any better
+    schedule has to make one of those first.
+    States reached before no later, with at least as many cookies and total_cookies and the
+    same holdings or one more purchase on top dominate it and prune it too: owning more never
+    slows a target down. The Pareto front per holdings is kept in memo, which holds at most
+    max_memo holdings, evicting the least recently used.
+
+    bound / shared_bound: best known turn, local and (when splitting across processes) shared
+    through a multiprocessing Value with the other searches.
+
+    """
+    sync_every = 256 # nodes between reads of the shared bound
+
+    def __init__(self, target, clicks_per_turn=1, bound=math.inf, max_nodes=None, shared_bound=None, max_memo=200000):
+        self.target = target
+        self.clicks_per_turn = clicks_per_turn
+        self.best = bound
+        self.best_actions = None
+        self.max_nodes = max_nodes
+        self.shared_bound = shared_bound
+
+        self.memo = OrderedDict() # (producer counts, upgrade mask) -> [(turn, cookies, total_cookies)]
+        self.max_memo = max_memo
+        self.nodes = 0
+        self.complete = True
+        self.action_index = None
+        self.dominance_upgrades = () # upgrades checked by dominated(), see search
+
+    def improve(self, turns, actions):
+        self.best, self.best_actions = turns, list(actions)
+        shared = self.shared_bound
+        if shared is not None:
+            with shared.get_lock():
+                if turns < shared.value:
+                    shared.value = turns
+
+    def dominated(self, game):
+        counts = tuple(p.n_owned for p in game.producers)
+        mask = game.upgrade_mask
+        key = (counts, mask)
+        turn, cookies, total = game.turn, game.cookies, game.total_cookies
+        memo = self.memo
+
+        # Holdings with one more producer, or one more upgrade the search can afford. They can
+        # copy any schedule from here (skipping what they own already) at least as fast, unless
+        # timed effects are in play
+        for i in range(len(counts) if not game.events else 0):
+            front = memo.get((counts[:i] + (counts[i] + 1,) + counts[i + 1:], mask))
+            if front is not None and any(t <= turn and c >= cookies and tc >= total for t, c, tc in front):
+                return True
+        for idx in self.dominance_upgrades if not game.events else ():
+            if not (mask >> idx) & 1:
+                front = memo.get((counts, mask | 1 << idx))
+                if front is not None and any(t <= turn and c >= cookies and tc >= total for t, c, tc in front):
+                    return True
+
+        front = memo.get(key)
+        if front is None:
+            self.memo[key] = [(turn, cookies, total)]
+            if len(self.memo) > self.max_memo:
+                self.memo.popitem(last=False)
+            return False
+
+        self.memo.move_to_end(key)
+
+        for t, c, tc in front:
+            if t <= turn and c >= cookies and tc >= total:
+                return True
+
+        front[:] = [e for e in front if not (turn <= e[0] and cookies >= e[1] and total >= e[2])]
+        front.append((turn, cookies, total))
+        return False
+
+    def children(self, game):
+        """(wait, flat action) of every useful purchase, best payback first."""
+        clicks = self.clicks_per_turn
+        # Anything dearer than the cookies waiting until the best known turn brings can't help
+        budget = math.inf
+        if self.best < math.inf:
+            rate = game.get_cpt() + clicks * game.get_cpc() if clicks else game.get_cpt()
+            budget = game.cookies + rate * (self.best - game.turn)
+        gains = sorted(game.marginal_gains(clicks, budget), key=lambda g: g.payback)
+
+        children = []
+        for gain in gains:
+            if gain.payback == math.inf:
+                break
+            wait = game.turns_until_affordable(gain.cost, clicks)
+            if wait is not None:
+                children.append((wait, self.action_index[(gain.kind, gain.idx)]))
+
+        return children
+
+    def search(self, game, actions=()):
+        """Search every schedule that starts from game, whose purchases so far are actions."""
+        if self.action_index is None:
+            self.action_index = {action: i for i, action in enumerate(game.catalog.actions)}
+
+        self.root = game
+        self.growth = None # GrowthBound, built once the first schedule bounds the horizon
+        self._search(game, list(actions))
+        return self
+
+    def _search(self, game, actions):
+        self.nodes += 1
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            self.complete = False
+            return
+
+        if self.shared_bound is not None and self.nodes % self.sync_every == 0:
+            shared = self.shared_bound.value
+            if shared < self.best:
+                self.best, self.best_actions = shared, None # found by another search
+
+        finish = self.target.turns_to_reach(game, self.clicks_per_turn)
+        if finish is not None and game.turn + finish < self.best:
+            self.improve(game.turn + finish, actions)
+            if finish == 0:
+                return
+
+        if self.best < math.inf:
+            if self.growth is None:
+                # Valid for every state below the first one searched once a schedule is known
+                self.growth = GrowthBound(self.root, self.target, self.clicks_per_turn, self.best - self.root.turn)
+                upgrades = self.root.upgrades_by_cost
+                self.dominance_upgrades = [idx for cost, idx in upgrades if cost <= self.growth.budget]
+            horizon = self.best - game.turn
+            if game.turn + self.target.turns_lower_bound(game, horizon, self.growth) >= self.best:
+                return
+
+        children = self.children(game)
+        if not children:
+            return
+
+        # Lower bound: finish now, or wait for at least the cheapest purchase first
+        first = min(wait for wait, _ in children)
+        if game.turn + min(first, math.inf if finish is None else finish) >= self.best:
+            return
+
+        for wait, action in children:
+            if game.turn + wait >= self.best:
+                continue
+
+            child = game.clone()
+            child.advance(wait, self.clicks_per_turn)
+            child.do_action(action)
+            if self.dominated(child):
+                continue
+
+            actions.append(action)
+            self._search(child, actions)
+            actions.pop()
+
+            if not self.complete:
+                return
+
+
+_shared_bound = None
+
+def _init_worker(shared_bound):
+    global _shared_bound
+    _shared_bound = shared_bound
+
+def _solve_subtree(game_cls, snapshot, actions, target, clicks_per_turn, max_nodes):
+    game = game_cls(verbose=False).restore(snapshot)
+    search = BranchAndBound(target, clicks_per_turn, _shared_bound.value, max_nodes, _shared_bound)
+    search.search(game, actions)
+    return search.best, search.best_actions, search.nodes, search.complete
+
+
+def solve(target, game=None, clicks_per_turn=1, workers=None, max_nodes=None):
+    """
+    Fewest-turns purchase schedule from game (a new game if None) to target, see Solution.
+
+    The greedy payback schedule is the starting bound. With workers > 1 each first purchase is
+    searched in its own process, the best turn found so far shared between them.
+    max_nodes: give up after this many states per search, returning the best schedule found
+               (optimal=False).
+
+    """
+    if game is None:
+        game = CookieClickerGame(verbose=False)
+    game = game.clone()
+    game.verbose = False
+
+    best, best_actions = greedy_schedule(game, target, clicks_per_turn)
+    workers = os.cpu_count() if workers is None else workers
+
+    root = BranchAndBound(target, clicks_per_turn, best, max_nodes)
+    root.best_actions = best_actions
+    if workers <= 1:
+        root.search(game)
+        return Solution(root.best, root.best_actions, root.complete, root.nodes)
+
+    # Split at the first purchase: the root itself is handled here, its subtrees in the pool
+    root.action_index = {action: i for i, action in enumerate(game.catalog.actions)}
+    root.nodes = 1
+    finish = target.turns_to_reach(game, clicks_per_turn)
+    if finish is not None and game.turn + finish < root.best:
+        root.improve(game.turn + finish, [])
+
+    subtrees = []
+    if finish != 0:
+        for wait, action in root.children(game):
+            if game.turn + wait < root.best:
+                child = game.clone()
+                child.advance(wait, clicks_per_turn)
+                child.do_action(action)
+                subtrees.append((child.snapshot(), [action]))
+
+    ctx = mp.get_context("spawn")
+    shared_bound = ctx.Value("d", root.best)
+    with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker, initargs=(shared_bound,)) as pool:
+        futures = [
+            pool.submit(_solve_subtree, type(game), snapshot, actions, target, clicks_per_turn, max_nodes)
+            for snapshot, actions in subtrees
+        ]
+        for future in futures:
+            turns, actions, nodes, complete = future.result()
+            root.nodes += nodes
+            root.complete = root.complete and complete
+            if turns < root.best and actions is not None:
+                root.best, root.best_actions = turns, actions
+
+    return Solution(root.best, root.best_actions, root.complete, root.nodes)
+
+
+if __name__ == "__main__":
+    print(solve(TotalCookiesTarget(1500)))
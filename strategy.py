@@ -0,0 +1,233 @@
+import heapq
+import itertools
+
+from game import CookieClickerGame
+
+
+class GreedyPaybackStrategy:
+    """
+    Baseline player: always buys the producer or upgrade with the shortest payback time
+    (cost / added income, see CookieClickerGame.marginal_gains), waiting with advance_until
+    until it is affordable.
+
+    Candidates are kept in a heap keyed by payback. After a purchase only the candidates whose
+    gain depends on what it changed are recomputed; their old heap entries are left in place and
+    skipped when popped (each candidate's entry carries a stamp, only the latest one is live).
+    Upgrades that target no producer (game multipliers, click CPS) gain a fixed share of total
+    production, so they sit in a second heap keyed by payback * cpt, which purchases don't move.
+
+    strategy = GreedyPaybackStrategy(CookieClickerGame(verbose=False))
+    strategy.play(10000)
+
+    """
+    def __init__(self, game, clicks_per_turn=1):
+        self.clicks_per_turn = clicks_per_turn
+        self.game = None
+        self.reset(game)
+
+    def reset(self, game=None):
+        """Start over on game (or the current game, in its current state)."""
+        if game is not None and (self.game is None or game.catalog is not self.game.catalog):
+            self.dependents, self.always, self.scaled = self.build_dependencies(game.catalog)
+        if game is not None:
+            self.game = game
+
+        self.heap = []
+        self.scaled_heap = []
+        self.scaled_cpt = 0 # cpt when the scaled candidates were last computed
+        self.stamps = {}
+        self.counter = itertools.count()
+        self.purchases = 0
+
+        self.refresh(self.candidates())
+        return self
+
+    def build_dependencies(self, catalog):
+        """
+        Returns (dependents, always, scaled):
+        dependents: producer index -> candidates whose gain changes when that producer's count or
+                    effects change
+        always: candidates recomputed after every purchase
+        scaled: candidates whose gain is a fixed share of total production
+
+        """
+        n_producers = len(catalog.producers)
+        cursor, grandma = catalog.cursor, catalog.grandma
+        grandma_targets = {u.add_producer for u in catalog.upgrades if hasattr(u, "add_producer")}
+        non_cursor = {q for q in range(n_producers) if q != cursor}
+
+        def production_deps(p):
+            # What producer p's production reads: itself, the grandma count if a grandma
+            # upgrade can target it, the non-cursor count if it is the cursor
+            deps = {p}
+            if p in grandma_targets:
+                deps.add(grandma)
+            if p == cursor:
+                deps |= non_cursor
+            return deps
+
+        dependents = {q: [] for q in range(n_producers)}
+        always = []
+        scaled = set()
+
+        for i in range(n_producers):
+            deps = production_deps(i)
+            if i != cursor:
+                deps |= production_deps(cursor) # per-other adds
+            if i == grandma:
+                for t in grandma_targets:
+                    deps |= production_deps(t)
+            for q in deps:
+                dependents[q].append(("buy_producer", i))
+
+        for upgrade in catalog.upgrades:
+            key = ("buy_upgrade", upgrade.idx)
+            affected = upgrade.affected_producers()
+
+            if not affected:
+                scaled.add(key)
+                continue
+                
+            # With clicks counted, the other click upgrades' gains also follow total production
+            # through the click CPS
+            if self.clicks_per_turn and upgrade.click_effect:
+                always.append(key)
+                continue
+
+            deps = set()
+            for p in affected:
+                deps |= production_deps(p)
+            for q in deps:
+                dependents[q].append(key)
+
+        return dependents, always, scaled
+
+    def candidates(self):
+        game = self.game
+        keys = [("buy_producer", i) for i in range(len(game.producers))]
+        keys.extend(("buy_upgrade", i) for _, i in game.upgrades_by_cost)
+        return keys
+
+    def refresh(self, keys):
+        """Recompute the gain of each candidate in keys and push its new heap entry."""
+        game = self.game
+        cpt = game.get_cpt()
+
+        for kind, idx in keys:
+            if kind == "buy_upgrade":
+                if game.owns_upgrade(idx):
+                    self.stamps.pop((kind, idx), None)
+                    continue
+                cost = game.upgrades[idx].cost
+                gain = game.upgrades[idx].marginal_gain(game)
+            else:
+                cost = game.producers[idx].current_price
+                gain = game.producer_gain(idx)
+
+            income = gain[0] + self.clicks_per_turn * gain[1]
+            if income <= 0:
+                self.stamps.pop((kind, idx), None) # revisited when something it depends on changes
+                continue
+
+            stamp = next(self.counter)
+            self.stamps[(kind, idx)] = stamp
+            if (kind, idx) in self.scaled:
+                self.scaled_cpt = cpt
+                heapq.heappush(self.scaled_heap, (cost / income * cpt, cost, stamp, kind, idx))
+            else:
+                heapq.heappush(self.heap, (cost / income, cost, stamp, kind, idx))
+
+    def _top(self, heap):
+        while heap:
+            entry = heap[0]
+            if self.stamps.get((entry[3], entry[4])) == entry[2]:
+                return entry
+            heapq.heappop(heap)
+
+        return None
+
+    def best(self):
+        """(payback, cost, kind, idx) of the best candidate, or None if nothing adds income."""
+        best = self._top(self.heap)
+        scaled = self._top(self.scaled_heap)
+        if scaled is not None:
+            payback = scaled[0] / self.game.get_cpt()
+            if best is None or payback < best[0]:
+                best = (payback,) + scaled[1:]
+
+        if best is None:
+            return None
+
+        payback, cost, _, kind, idx = best
+        return payback, cost, kind, idx
+
+    def purchased(self, kind, idx):
+        """Update the candidates affected by a purchase made on the game."""
+        game = self.game
+
+        if kind == "buy_producer":
+            keys = set(self.dependents[idx])
+        else:
+            self.stamps.pop((kind, idx), None) # owned now, never a candidate again
+            upgrade = game.upgrades[idx]
+            affected = upgrade.affected_producers()
+            if not affected or (self.clicks_per_turn and upgrade.click_effect):
+                # Scales every candidate's gain
+                self.refresh(self.candidates())
+                return
+            keys = set()
+            for p in affected:
+                keys.update(self.dependents[p])
+
+        keys.update(self.always)
+        if not self.scaled_cpt:
+            keys.update(self.scaled) # no production to scale yet
+        self.refresh(keys)
+
+    def step(self, max_turns=None):
+        """
+        Wait for and buy the best candidate. Returns (kind, idx) of the purchase, or None if
+        nothing was bought: nothing adds income, it will never be affordable, or it would take
+        more than max_turns turns (the game is not advanced then).
+
+        """
+        game = self.game
+        best = self.best()
+        if best is None:
+            return None
+
+        _, cost, kind, idx = best
+        n_turns = game.turns_until_affordable(cost, self.clicks_per_turn)
+        if n_turns is None or (max_turns is not None and n_turns > max_turns):
+            return None
+
+        game.advance(n_turns, self.clicks_per_turn)
+        getattr(game, kind)(idx)
+        self.purchases += 1
+
+        if game.events or game.buffs:
+            self.refresh(self.candidates()) # timed effects may have moved while waiting
+        else:
+            self.purchased(kind, idx)
+
+        return kind, idx
+
+    def play(self, n_turns):
+        """Play greedily until game.turn reaches n_turns. Returns the game."""
+        game = self.game
+        while game.turn < n_turns:
+            if self.step(n_turns - game.turn) is None:
+                game.advance(n_turns - game.turn, self.clicks_per_turn)
+
+        return game
+
+
+def play_greedy(n_turns, seed=None, clicks_per_turn=1, game_cls=CookieClickerGame):
+    """One greedy game of n_turns turns from scratch. Returns the game."""
+    game = game_cls(verbose=False, seed=seed)
+    return GreedyPaybackStrategy(game, clicks_per_turn).play(n_turns)
+
+
+if __name__ == "__main__":
+    game = play_greedy(100000)
+    print(game)
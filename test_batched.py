@@ -0,0 +1,54 @@
+import random
+
+import numpy as np
+import pytest
+
+from batched import BatchedCookieClickerGame
+from game import CookieClickerGame
+
+
+def test_batched_matches_scalar():
+    rng = random.Random(0)
+    n_games = 8
+    batched = BatchedCookieClickerGame(n_games, cookies=50)
+    games = [CookieClickerGame(verbose=False) for _ in range(n_games)]
+    for game in games:
+        game.reset(cookies=50)
+    P = batched.tables.n_producers
+    
+    for step in range(2000):
+        mask = batched.get_action_mask()
+        actions = [rng.choice(np.flatnonzero(row)) for row in mask]
+        ok = batched.apply_actions(actions)
+        
+        for game, action, done in zip(games, actions, ok):
+            if action == 0:
+                game.click()
+                succeeded = True
+            elif action <= P:
+                succeeded = game.buy_producer(action - 1)
+            elif action <= 2 * P:
+                succeeded = game.sell_producer(action - 1 - P)
+            else:
+                succeeded = game.buy_upgrade(action - 1 - 2 * P)
+            assert succeeded == done
+            
+        n_turns = rng.choice([1, 1, 1, 5, 50])
+        batched.advance(n_turns, clicks_per_turn=1)
+        for game in games:
+            game.advance(n_turns, 1)
+            
+        for i, game in enumerate(games):
+            assert tuple(batched.owned[i]) == tuple(p.n_owned for p in game.producers)
+            assert batched.turn[i] == game.turn
+            assert batched.cookies[i] == pytest.approx(game.cookies, rel=1e-9, abs=1e-6)
+            assert batched.total_cookies[i] == pytest.approx(game.total_cookies, rel=1e-9, abs=1e-6)
+            
+def test_restore_rejects_counts_past_max_owned():
+    game = CookieClickerGame(verbose=False)
+    game.reset(cookies=1e9)
+    game.buy_producer(0, 20)
+    
+    batched = BatchedCookieClickerGame(2, max_owned=10)
+    with pytest.raises(ValueError, match="max_owned"):
+        batched.restore(0, game.snapshot())
@@ -0,0 +1,62 @@
+from game import CookieClickerGame, UpdateUpgrade, FRENZY
+
+
+def test_sell_producer_rejects_non_positive_count():
+    game = CookieClickerGame(verbose=False)
+    
+    assert not game.sell_producer(0, -3)
+    assert not game.sell_producer(0, 0)
+    assert game.producers[0].n_owned == 0
+    assert game.cookies == 0
+    
+def test_buy_producer_rejects_non_positive_count():
+    game = CookieClickerGame(verbose=False)
+    game.reset(cookies=1000)
+    
+    assert not game.buy_producer(0, 0)
+    assert not game.buy_producer(0, -2)
+    assert game.producers[0].n_owned == 0
+    assert game.cookies == 1000
+    
+def test_restore_is_bit_exact():
+    for seed in range(20):
+        game = CookieClickerGame(verbose=False, seed=seed)
+        game.reset(cookies=1e40, seed=seed)
+        for _ in range(300):
+            game.random_action(weights=[0, 3, 1, 3]) # upgrades in random order
+        
+        restored = CookieClickerGame(verbose=False).restore(game.snapshot())
+        game.invalidate()
+        assert (restored.get_cpt(), restored.get_cpc()) == (game.get_cpt(), game.get_cpc())
+        
+        game.advance(100, 3)
+        restored.advance(100, 3)
+        assert (restored.cookies, restored.total_cookies) == (game.cookies, game.total_cookies)
+    
+    
+class Compounding(UpdateUpgrade):
+    __slots__ = ()
+    
+    period = 3
+    
+    def update(self, game):
+        game.multiplier *= 1.01
+        
+class CompoundingGame(CookieClickerGame):
+    upgrade_spec = CookieClickerGame.upgrade_spec + [dict(type=Compounding, name="compounding", cost=10)]
+    
+def test_restore_keeps_update_effects_and_events():
+    game = CompoundingGame(verbose=False)
+    game.reset(cookies=100)
+    game.buy_producer(0)
+    game.buy_upgrade(len(game.upgrades) - 1)
+    game.add_buff(FRENZY, 20, turn=7)
+    game.advance(10, 1)
+    
+    restored = CompoundingGame(verbose=False).restore(game.snapshot())
+    assert restored.get_cpt() == game.get_cpt()
+    
+    for g in (game, restored):
+        g.advance(30, 1)
+    assert restored.multiplier == game.multiplier
+    assert (restored.cookies, restored.buffs) == (game.cookies, game.buffs)
@@ -0,0 +1,10 @@
+from game import CookieClickerGame
+from mcts import MCTSPlanner
+from strategy import play_greedy
+
+
+def test_planner_matches_greedy():
+    for n_turns in (300, 600):
+        game = MCTSPlanner(iterations=10).play(CookieClickerGame(verbose=False), n_turns)
+        assert game.turn == n_turns
+        assert game.total_cookies >= play_greedy(n_turns).total_cookies
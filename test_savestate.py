@@ -0,0 +1,30 @@
+import savestate
+from game import CookieClickerGame
+
+
+def test_loads_is_bit_exact():
+    game = CookieClickerGame(verbose=False, seed=0)
+    game.reset(cookies=1e40, seed=0)
+    for _ in range(300):
+        game.random_action(weights=[0, 3, 1, 3])
+        
+    loaded = savestate.loads(savestate.dumps(game))
+    game.invalidate()
+    assert (loaded.get_cpt(), loaded.cookies, loaded.turn) == (game.get_cpt(), game.cookies, game.turn)
+    
+def test_loads_keeps_update_upgrade_running():
+    from test_game import CompoundingGame
+    
+    game = CompoundingGame(verbose=False)
+    game.reset(cookies=100)
+    game.buy_producer(0)
+    game.buy_upgrade(len(game.upgrades) - 1)
+    game.advance(30, 1) # in phase: an update just ran, as a loaded game assumes
+    
+    loaded = savestate.loads(savestate.dumps(game), CompoundingGame(verbose=False))
+    for g in (game, loaded):
+        g.advance(40, 1)
+        
+    assert loaded.multiplier == game.multiplier > 1.1
+    assert loaded.cookies == game.cookies
+    assert loaded.total_cookies == game.total_cookies
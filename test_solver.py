@@ -0,0 +1,10 @@
+from game import CookieClickerGame
+from solver import TotalCookiesTarget, play_schedule, solve
+
+
+def test_small_target_is_solved_optimally():
+    solution = solve(TotalCookiesTarget(1000), workers=1)
+    
+    assert solution.optimal
+    assert solution.turns == 356
+    assert play_schedule(CookieClickerGame(verbose=False), solution.actions, TotalCookiesTarget(1000)) == solution.turns